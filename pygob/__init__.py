@@ -1,17 +1,56 @@
 from .loader import Loader
+from .decoder import Decoder
 from .dumper import Dumper
+from .stream_encoder import StreamEncoder
+from .cache import TypeCache
+from .parallel import load_all_parallel
+from .archive import Archive
+from .aio import aload_all
+from .batch import load_many
 
 
-def load(buf):
-    """Load and decode a bytes object."""
-    loader = Loader()
-    return loader.load(buf)
+def load(buf, select=None, cache=None):
+    """Load and decode a bytes object. With select, a list of dotted
+    paths such as 'Depots.*.Id', only those paths are decoded and
+    returned in a dict keyed by path. A TypeCache shares decoded types
+    with other calls using the same cache."""
+    loader = Loader(cache=cache)
+    return loader.load(buf, select=select)
+
+
+def load_all(buf, select=None, cache=None):
+    """Decode all gobs in a bytes object, optionally projected and
+    cached as in load()."""
+    loader = Loader(cache=cache)
+    return loader.load_all(buf, select=select)
+
+
+def load_file(path, mmap=True, copy=False):
+    """Decode all gobs in a file, memory-mapping it by default. Byte
+    slices and strings are views into the file unless copy is true."""
+    loader = Loader(copy=copy)
+    return loader.load_file(path, mmap=mmap)
+
+
+def load_columns(buf, path='', arrow=False, **options):
+    """Decode the slice of structs at path, such as 'Depots', in the
+    first gob of buf into per-field columns: NumPy arrays for numbers
+    and offset and data buffers for strings and byte slices, or a
+    pyarrow.Table with arrow=True. See pygob.columns."""
+    from .columns import load_columns
+    return load_columns(buf, path=path, arrow=arrow, **options)
+
+
+def open(path, index=True, **options):
+    """Open a gob file for random access by message number, building or
+    reusing a sidecar index. See pygob.archive.Archive."""
+    return Archive(path, index=index, **options)
 
 
-def load_all(buf):
-    """Decode all gobs in a bytes object."""
+def iter_load(fileobj):
+    """Decode all gobs in a binary file object as they are read."""
     loader = Loader()
-    return loader.load_all(buf)
+    return loader.iter_load(fileobj)
 
 
 def dump(value):
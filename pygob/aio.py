@@ -0,0 +1,74 @@
+"""Decoding gob streams from asyncio byte sources.
+
+aload_all feeds chunks from an async byte source, such as an httpx
+response's aiter_bytes() or an aiofiles file, into a Decoder and yields
+values as soon as their segments are complete.
+"""
+
+from .decoder import Decoder
+
+# Bytes fed to the decoder at a time; the event loop gets a chance to
+# run other tasks in between.
+CHUNK_SIZE = 64 * 1024
+
+
+async def aload_all(source, loader=None, executor=None,
+                    chunk_size=CHUNK_SIZE):
+    """Decode all gobs from source, an async iterable of byte chunks or
+    an object with an async read(size) method, yielding each value.
+
+    >>> import asyncio
+    >>> async def chunks():
+    ...     for chunk in (b'\\x03\\x04', b'\\x00\\x06\\x03\\x04\\x00\\x07'):
+    ...         yield chunk
+    >>> async def main():
+    ...     return [value async for value in aload_all(chunks())]
+    >>> asyncio.run(main())
+    [3, -4]
+
+    Large chunks are fed chunk_size bytes at a time, and control returns
+    to the event loop between pieces. With executor, a
+    concurrent.futures.Executor or True for the loop's default one,
+    decoding runs in that executor instead, so the loop is not blocked
+    even by a single large segment.
+    """
+    import asyncio
+
+    loop = asyncio.get_running_loop()
+    if executor is True:
+        executor = None
+        offload = True
+    else:
+        offload = executor is not None
+    decoder = Decoder(loader)
+
+    async for chunk in _chunks(source, chunk_size):
+        view = memoryview(chunk)
+        for start in range(0, len(view), chunk_size):
+            piece = view[start:start + chunk_size]
+            if offload:
+                values = await loop.run_in_executor(executor, decoder.feed,
+                                                    piece)
+            else:
+                values = decoder.feed(piece)
+            for value in values:
+                yield value
+            if not offload:
+                await asyncio.sleep(0)
+    decoder.close()
+
+
+async def _chunks(source, chunk_size):
+    """Yield the byte chunks of source. Files are read in chunk_size
+    pieces rather than iterated, which would split them into lines.
+    """
+    read = getattr(source, 'read', None)
+    if read is None:
+        async for chunk in source:
+            yield chunk
+        return
+    while True:
+        chunk = await read(chunk_size)
+        if not chunk:
+            return
+        yield chunk
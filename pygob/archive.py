@@ -0,0 +1,177 @@
+"""Random access to the messages of a gob file.
+
+An Archive indexes a multi-message gob file once: the offset and type
+id of every value, and the type definitions that came before it. The
+index is kept next to the file as <path>.idx, a small JSON document, and
+reused as long as the file has the same size and modification time.
+Any message can then be decoded without decoding the ones before it,
+only the type definitions it depends on.
+"""
+
+import mmap
+import os
+
+from .loader import Loader, scan_segments
+
+INDEX_SUFFIX = '.idx'
+INDEX_VERSION = 1
+
+
+def build_index(buf):
+    """Index the stream in buf. Returns a dict with, for every value,
+    its offset, its type id and the number of type definitions before it,
+    and the offsets of the definitions with whether each one redefines
+    an earlier type id.
+    """
+    offsets = []
+    typeids = []
+    defined = []
+    definitions = []
+    redefines = []
+    seen = set()
+    for start, end, typeid in scan_segments(buf):
+        if typeid < 0:
+            definitions.append(start)
+            redefines.append(-typeid in seen)
+            seen.add(-typeid)
+        else:
+            offsets.append(start)
+            typeids.append(typeid)
+            defined.append(len(definitions))
+    return {
+        'version': INDEX_VERSION,
+        'offsets': offsets,
+        'typeids': typeids,
+        'defined': defined,
+        'definitions': definitions,
+        'redefines': redefines,
+    }
+
+
+class Archive:
+    """A gob file opened for random access, see pygob.open.
+
+    >>> import os, tempfile
+    >>> from pygob import Dumper
+    >>> dumper = Dumper()
+    >>> path = os.path.join(tempfile.mkdtemp(), 'points.gob')
+    >>> with open(path, 'wb') as f:
+    ...     _ = f.write(b''.join(dumper.dump((i, i * i)) for i in range(10)))
+    >>> with Archive(path) as archive:
+    ...     len(archive), archive[3], archive[-2:]
+    (10, (3, 9), [(8, 64), (9, 81)])
+    >>> os.path.exists(path + '.idx')
+    True
+    """
+
+    def __init__(self, path, index=True, **options):
+        """Open the gob file at path. Loader options are passed on.
+
+        With index=True the index is read from, or written to, the
+        sidecar file; a sidecar that cannot be written is skipped. With
+        index=False it is built in memory only.
+        """
+        self.path = path
+        self._options = options
+        with open(path, 'rb') as f:
+            stat = os.fstat(f.fileno())
+            if stat.st_size:
+                self._buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                self._buf = b''
+        self._stamp = [stat.st_size, stat.st_mtime_ns]
+        self._index = self._read_index() if index else None
+        if self._index is None:
+            self._index = build_index(self._buf)
+            if index:
+                self._write_index()
+        self._offsets = self._index['offsets']
+        self._defined = self._index['defined']
+        self._definitions = self._index['definitions']
+        self._redefines = self._index['redefines']
+        self._loader = None
+        self._applied = 0
+
+    def _read_index(self):
+        # Imported here, json and re are slow to import.
+        import json
+
+        try:
+            with open(self.path + INDEX_SUFFIX) as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if (index.get('version') != INDEX_VERSION or
+                index.get('stamp') != self._stamp):
+            return None
+        return index
+
+    def _write_index(self):
+        import json
+
+        self._index['stamp'] = self._stamp
+        try:
+            with open(self.path + INDEX_SUFFIX, 'w') as f:
+                json.dump(self._index, f, separators=(',', ':'))
+        except OSError:
+            pass
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self.get(j) for j in range(*i.indices(len(self)))]
+        return self.get(i)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.get(i)
+
+    def typeid(self, i):
+        """Return the type id of the i-th value."""
+        return self._index['typeids'][i]
+
+    def get(self, i):
+        """Decode and return the i-th value of the file."""
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError('message %d out of range' % i)
+        loader = self._loader_for(self._defined[i])
+        buf = memoryview(self._buf).toreadonly()
+        return loader._load(buf, self._offsets[i])[0]
+
+    def _loader_for(self, needed):
+        """Return a loader knowing the first needed type definitions.
+
+        Definitions are decoded incrementally. A loader that has seen
+        more of them can be reused unless one of the extra ones
+        redefines a type id; then a new loader starts over.
+        """
+        if (self._loader is None or
+                any(self._redefines[needed:self._applied])):
+            self._loader = Loader(**self._options)
+            self._applied = 0
+        buf = memoryview(self._buf).toreadonly()
+        loader = self._loader
+        for start in self._definitions[self._applied:needed]:
+            loader._load_segment(loader._read_segment(buf, start)[0])
+        self._applied = max(self._applied, needed)
+        return loader
+
+    def close(self):
+        """Close the file. With copy=False, the mapping stays open for as
+        long as views into it are alive."""
+        self._loader = None
+        if isinstance(self._buf, mmap.mmap):
+            try:
+                self._buf.close()
+            except BufferError:
+                pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
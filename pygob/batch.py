@@ -0,0 +1,113 @@
+"""Decoding many small independent gobs.
+
+Payloads sent one by one, each by its own Go encoder, repeat the same
+type definitions in every blob. load_many decodes a batch of them with
+one TypeCache, so the definitions of a schema are decoded once for the
+whole batch and every further blob only looks them up, and optionally
+spreads the blobs over a pool of threads or processes.
+"""
+
+from .cache import TypeCache
+from .loader import Loader
+
+EXECUTORS = (None, 'thread', 'process')
+
+# Blobs are handed to the workers of a pool in this many chunks per
+# worker, so that uneven blobs still spread evenly.
+CHUNKS_PER_WORKER = 4
+
+# The type cache of a worker process, shared by the chunks it decodes.
+_worker_cache = None
+
+
+def load_many(blobs, executor=None, workers=None, cache=None, **options):
+    """Decode the first gob of every blob and return the values in a
+    list, in the order of blobs. A blob that cannot be decoded gives the
+    exception raised for it instead of a value; the others are decoded
+    all the same:
+
+    >>> from pygob import Dumper
+    >>> blobs = [Dumper().dump((i, -i)) for i in range(3)]
+    >>> results = load_many(blobs + [blobs[0][:-2]])
+    >>> results[:3], isinstance(results[3], Exception)
+    ([(0, 0), (1, -1), (2, -2)], True)
+
+    Blobs share one TypeCache, cache if given. With executor='thread' or
+    'process', blobs are decoded by a pool of that many workers, all of
+    the CPUs by default. Threads share the cache; they run in parallel
+    on free-threaded builds of Python. Processes have a cache each and
+    pickle the values back, so copy=False and lazy=True are not
+    available with them. Other options are passed on to every Loader.
+    Every value is decoded anew, even in threads sharing the types of the
+    cache:
+
+    >>> import sys
+    >>> from typing import NamedTuple
+    >>> class Chunk(NamedTuple):
+    ...     Id: int
+    ...     Data: bytearray
+    >>> interval = sys.getswitchinterval()
+    >>> sys.setswitchinterval(1e-6)
+    >>> values = []
+    >>> for _ in range(100):
+    ...     values += load_many([Dumper().dump(Chunk(1, bytearray()))] * 32,
+    ...                         executor='thread', workers=4)
+    >>> sys.setswitchinterval(interval)
+    >>> len({id(value.Data) for value in values}) == len(values)
+    True
+    """
+    if executor not in EXECUTORS:
+        raise ValueError('unknown executor: %r' % (executor, ))
+    # Bad options are an error of the call, not of every blob.
+    Loader(**options)
+    blobs = list(blobs)
+    if cache is None:
+        cache = TypeCache()
+    if executor is None:
+        return decode_blobs(blobs, cache, options)
+
+    import os
+    if workers is None:
+        workers = os.cpu_count() or 1
+    size = max(1, -(-len(blobs) // (workers * CHUNKS_PER_WORKER)))
+    chunks = [blobs[start:start + size]
+              for start in range(0, len(blobs), size)]
+    if executor == 'thread':
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(decode_blobs, chunk, cache, options)
+                       for chunk in chunks]
+    else:
+        if options.get('copy') is False or options.get('lazy'):
+            raise ValueError('copy=False and lazy=True cannot be used '
+                             'with executor=\'process\'')
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            # Views and other buffers cannot be pickled.
+            futures = [pool.submit(_decode_in_worker,
+                                   [bytes(blob) for blob in chunk], options)
+                       for chunk in chunks]
+    results = []
+    for future in futures:
+        results.extend(future.result())
+    return results
+
+
+def decode_blobs(blobs, cache, options):
+    """Decode the first gob of every blob with a Loader per blob sharing
+    cache. Returns a list of values and exceptions.
+    """
+    results = []
+    for blob in blobs:
+        try:
+            results.append(Loader(cache=cache, **options).load(blob))
+        except Exception as error:
+            results.append(error)
+    return results
+
+
+def _decode_in_worker(blobs, options):
+    global _worker_cache
+    if _worker_cache is None:
+        _worker_cache = TypeCache()
+    return decode_blobs(blobs, _worker_cache, options)
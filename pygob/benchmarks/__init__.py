@@ -0,0 +1,6 @@
+"""Benchmarks for pygob, run as python -m pygob.benchmarks.<name>.
+
+suite measures throughput and peak memory over the synthetic streams
+of fixtures; startup and records measure setup cost and record kinds;
+compiled compares generated struct decoders with the generic ones.
+"""
@@ -0,0 +1,56 @@
+"""Compare generated struct decoders with the generic ones.
+
+    python -m pygob.benchmarks.compiled [scenario ...]
+
+For every scenario in pygob.benchmarks.fixtures whose values are
+structs, generates a decoder module with pygob.compile from its stream
+and reports the time per value of decoding the whole stream with a
+plain Loader and with Loader(compiled=module), best of several runs.
+"""
+
+import importlib
+import os
+import sys
+import tempfile
+import timeit
+
+from pygob import Loader
+from pygob.benchmarks import fixtures
+from pygob.compile import generate
+
+# Scenarios made of structs, where there is something to compile.
+SCENARIOS = ('scalars', 'strings', 'byte_slices', 'nested', 'small_messages')
+
+
+def best(func, repeat=5):
+    """Best time of a single call of func."""
+    number = max(1, int(0.2 / timeit.timeit(func, number=1)))
+    return min(timeit.repeat(func, number=number, repeat=repeat)) / number
+
+
+def main(argv=None):
+    scenarios = (argv if argv is not None else sys.argv[1:]) or SCENARIOS
+    print('%-16s %10s %12s %12s %8s' % (
+        'scenario', 'values', 'generic us', 'compiled us', 'speedup'))
+    with tempfile.TemporaryDirectory() as tmp:
+        sys.path.insert(0, tmp)
+        try:
+            for scenario in scenarios:
+                _, buf = fixtures.stream(scenario)
+                name = 'pygob_compiled_' + scenario
+                with open(os.path.join(tmp, name + '.py'), 'w') as f:
+                    f.write(generate(buf, scenario + '.gob'))
+                module = importlib.import_module(name)
+                count = len(list(Loader().load_all(buf)))
+                generic = best(lambda: list(Loader().load_all(buf)))
+                compiled = best(
+                    lambda: list(Loader(compiled=module).load_all(buf)))
+                print('%-16s %10d %12.2f %12.2f %7.2fx' % (
+                    scenario, count, generic / count * 1e6,
+                    compiled / count * 1e6, generic / compiled))
+        finally:
+            sys.path.remove(tmp)
+
+
+if __name__ == '__main__':
+    main()
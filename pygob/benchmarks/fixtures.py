@@ -0,0 +1,106 @@
+"""Synthetic gob streams for the benchmarks.
+
+Every scenario is a function returning a list of Python values. The
+stream for a scenario is the values dumped one after the other with a
+single Dumper, so that types are defined once, as Go would send them.
+No Go toolchain is needed; the values are deterministic.
+"""
+
+import random
+from typing import NamedTuple
+
+from pygob import Dumper
+
+
+class Sample(NamedTuple):
+    Id: int
+    X: float
+    Y: float
+    Ok: bool
+    Count: int
+
+
+class Words(NamedTuple):
+    Id: int
+    Words: list[str]
+
+
+class Blob(NamedTuple):
+    Id: int
+    Name: str
+    Data: bytearray
+
+
+class Node(NamedTuple):
+    Value: int
+    Children: list['Node']
+
+
+class Point(NamedTuple):
+    X: int
+    Y: int
+
+
+def scalars():
+    """Structs made of numbers and booleans only."""
+    rand = random.Random(1)
+    return [[Sample(i, rand.random(), rand.uniform(-1e6, 1e6), i % 3 == 0,
+                    rand.randrange(1 << 40))
+             for i in range(2000)] for _ in range(10)]
+
+
+def strings():
+    """Long lists of short and medium strings."""
+    rand = random.Random(2)
+    return [Words(i, ['w%d' % rand.randrange(10 ** rand.randrange(1, 12))
+                      for _ in range(5000)]) for i in range(10)]
+
+
+def byte_slices():
+    """A few large opaque payloads with a little metadata."""
+    rand = random.Random(3)
+    return [Blob(i, 'blob%d' % i, bytearray(rand.randbytes(256 * 1024)))
+            for i in range(16)]
+
+
+def nested():
+    """Deep trees of recursive structs."""
+    def tree(depth, value):
+        if depth == 0:
+            return Node(value, [])
+        return Node(value, [tree(depth - 1, value * 2 + i) for i in range(2)])
+    return [tree(10, i) for i in range(8)]
+
+
+def maps():
+    """Maps from strings to numbers."""
+    rand = random.Random(4)
+    return [{'key%d' % k: rand.randrange(1 << 32) for k in range(10000)}
+            for _ in range(8)]
+
+
+def small_messages():
+    """Many tiny messages of the same type."""
+    return [Point(i, -i) for i in range(20000)]
+
+
+SCENARIOS = {
+    'scalars': scalars,
+    'strings': strings,
+    'byte_slices': byte_slices,
+    'nested': nested,
+    'maps': maps,
+    'small_messages': small_messages,
+}
+
+
+def dump_all(values):
+    """Dump values into a single stream."""
+    dumper = Dumper()
+    return b''.join(dumper.dump(value) for value in values)
+
+
+def stream(name):
+    """Return the values of scenario name and their stream."""
+    values = SCENARIOS[name]()
+    return values, dump_all(values)
@@ -0,0 +1,82 @@
+"""Compare the record kinds of Loader(record=...).
+
+    python -m pygob.benchmarks.records
+
+Decodes a stream of nested structs, shaped like app info with depots
+and manifests, with every record kind. For each kind it reports the
+memory the decoded values hold per struct, including their field
+values, measured with tracemalloc, and the decode time.
+"""
+
+import time
+import tracemalloc
+from typing import NamedTuple
+
+from pygob import Dumper, Loader
+from pygob.records import RECORDS
+
+APPS = 500
+DEPOTS = 4
+MANIFESTS = 3
+
+
+class Manifest(NamedTuple):
+    Id: int
+    Size: int
+
+
+class Depot(NamedTuple):
+    Id: int
+    Name: str
+    Manifests: list[Manifest]
+
+
+class App(NamedTuple):
+    Appid: int
+    Name: str
+    Depots: list[Depot]
+
+
+def stream():
+    """Return the stream and the number of structs in it."""
+    apps = [App(appid, 'app%d' % appid, [
+        Depot(appid * 10 + d, 'depot%d' % d, [
+            Manifest(appid * 100 + d * 10 + m, 1 << 20 + m)
+            for m in range(MANIFESTS)])
+        for d in range(DEPOTS)]) for appid in range(APPS)]
+    structs = APPS * (1 + DEPOTS * (1 + MANIFESTS))
+    dumper = Dumper()
+    return b''.join(dumper.dump(app) for app in apps), structs
+
+
+def measure(buf, record):
+    """Return the bytes held by the decoded values and the best decode
+    time, which is measured without tracing."""
+    seconds = min(_decode_time(buf, record) for _ in range(5))
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    values = list(Loader(record=record).load_all(buf))
+    held = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del values
+    return held, seconds
+
+
+def _decode_time(buf, record):
+    start = time.perf_counter()
+    list(Loader(record=record).load_all(buf))
+    return time.perf_counter() - start
+
+
+def main():
+    buf, structs = stream()
+    print('%d structs, %d bytes' % (structs, len(buf)))
+    print('%-12s %14s %12s' % ('record', 'bytes/struct', 'decode ms'))
+    for record in RECORDS:
+        held, seconds = measure(buf, record)
+        print('%-12s %14.1f %12.1f' % (record, held / structs,
+                                       seconds * 1e3))
+
+
+if __name__ == '__main__':
+    main()
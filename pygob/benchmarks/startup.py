@@ -0,0 +1,65 @@
+"""Measure the cost of getting ready to decode.
+
+    python -m pygob.benchmarks.startup
+
+Reports the time to import pygob and create the first Loader in a fresh
+interpreter, to create further loaders, and to register a struct type
+from a stream, next to what a collections.namedtuple class costs.
+"""
+
+import collections
+import subprocess
+import sys
+import timeit
+
+from pygob import Loader
+from pygob.records import record_class
+
+# Go's encoding of Point{22, 33}: one struct definition and one value.
+POINT = bytes.fromhex('1f ff 81 03 01 01 05 50 6f 69 6e 74 01 ff 82 00 01 02'
+                      '01 01 58 01 04 00 01 01 59 01 04 00 00 00 07 ff 82 01'
+                      '2c 01 42 00')
+
+COLD_START = '''
+import time
+start = time.perf_counter()
+import pygob
+pygob.Loader()
+print(time.perf_counter() - start)
+'''
+
+
+def cold_start(repeat=10):
+    """Best time of importing pygob and creating a Loader in a new
+    interpreter."""
+    times = []
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, '-c', COLD_START], check=True,
+                             capture_output=True, text=True).stdout
+        times.append(float(out))
+    return min(times)
+
+
+def best(stmt, number, repeat=5):
+    """Best time of a single run of stmt."""
+    return min(timeit.repeat(stmt, number=number, repeat=repeat)) / number
+
+
+def main():
+    fields = ['Appid', 'Licenses', 'Depots', 'Name', 'Tags']
+    results = [
+        ('import pygob + Loader()', cold_start()),
+        ('Loader()', best(Loader, 10000)),
+        ('decode a definition and a value', best(
+            lambda: Loader().load(POINT), 2000)),
+        ('record_class, 5 fields', best(
+            lambda: record_class('AppInfo', fields), 2000)),
+        ('namedtuple, 5 fields', best(
+            lambda: collections.namedtuple('AppInfo', fields), 2000)),
+    ]
+    for name, seconds in results:
+        print('%-34s %10.1f us' % (name, seconds * 1e6))
+
+
+if __name__ == '__main__':
+    main()
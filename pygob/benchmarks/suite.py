@@ -0,0 +1,192 @@
+"""Throughput and memory benchmarks over the synthetic scenarios.
+
+    python -m pygob.benchmarks.suite [--save] [--compare]
+        [--baseline FILE] [--threshold 0.15] [scenario ...]
+
+For every scenario in pygob.benchmarks.fixtures, measures:
+
+    load      decoding the first value of the stream with a new Loader
+    load_all  decoding every value of the stream
+    dump      encoding every value with a new Dumper
+
+and reports MB/s and values/s of the best of several runs, together
+with the peak RSS of the process doing it. Each measurement runs in a
+fresh interpreter, so peak RSS is its own and not left over from other
+scenarios.
+
+--save writes the results to the JSON baseline, baseline.json next to
+this file unless --baseline says otherwise. --compare reads it and
+flags results whose throughput fell, or whose peak RSS grew, by more
+than the threshold; the exit status is 1 if any did.
+Throughput depends on the machine and how busy it is: compare against
+a baseline saved on the same, otherwise idle, machine.
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from pygob import Loader
+from pygob.benchmarks import fixtures
+
+OPERATIONS = ('load', 'load_all', 'dump')
+
+# Default place of the baseline, next to this file.
+BASELINE = os.path.join(os.path.dirname(__file__), 'baseline.json')
+
+# Minimum time spent repeating an operation.
+MIN_TIME = 0.3
+
+
+def _first_length(buf):
+    """Return the length of the stream up to the end of the first value."""
+    return Loader()._load(memoryview(buf), 0)[1]
+
+
+def operation(name, values, buf):
+    """Return a function running operation name once, the number of
+    bytes and the number of values it handles.
+    """
+    if name == 'load':
+        return (lambda: Loader().load(buf)), _first_length(buf), 1
+    if name == 'load_all':
+        return (lambda: list(Loader().load_all(buf))), len(buf), len(values)
+    if name == 'dump':
+        return (lambda: fixtures.dump_all(values)), len(buf), len(values)
+    raise ValueError('unknown operation: %r' % name)
+
+
+def peak_rss():
+    """Return the peak resident set size of this process in bytes."""
+    # ru_maxrss survives exec, so in a child it can be the parent's.
+    # Linux resets VmHWM instead.
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS.
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+def run(scenario, name, path):
+    """Measure one operation on the stream stored at path, in this
+    process, and return the result as a dict.
+    """
+    with open(path, 'rb') as f:
+        buf = f.read()
+    values = fixtures.SCENARIOS[scenario]() if name == 'dump' else (
+        list(Loader().load_all(buf)))
+    func, size, count = operation(name, values, buf)
+
+    best = float('inf')
+    spent = 0.0
+    runs = 0
+    while spent < MIN_TIME or runs < 3:
+        start = time.perf_counter()
+        func()
+        seconds = time.perf_counter() - start
+        best = min(best, seconds)
+        spent += seconds
+        runs += 1
+
+    return {
+        'mb_per_s': size / best / 1e6,
+        'values_per_s': count / best,
+        'peak_rss_mb': peak_rss() / 1e6,
+        'bytes': size,
+        'values': count,
+    }
+
+
+def run_all(scenarios):
+    """Measure every operation of every scenario, each in a child
+    process. Returns {'scenario/operation': result}.
+    """
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for scenario in scenarios:
+            path = os.path.join(tmp, scenario + '.gob')
+            with open(path, 'wb') as f:
+                f.write(fixtures.stream(scenario)[1])
+            for name in OPERATIONS:
+                out = subprocess.run(
+                    [sys.executable, '-m', 'pygob.benchmarks.suite',
+                     '--child', scenario, name, path],
+                    check=True, capture_output=True, text=True).stdout
+                results['%s/%s' % (scenario, name)] = json.loads(out)
+    return results
+
+
+def regressions(results, baseline, threshold):
+    """Return the keys of results that are worse than baseline."""
+    worse = []
+    for key, result in results.items():
+        base = baseline.get(key)
+        if base is None:
+            continue
+        if (result['mb_per_s'] < base['mb_per_s'] * (1 - threshold) or
+                result['peak_rss_mb'] > base['peak_rss_mb'] * (1 + threshold)):
+            worse.append(key)
+    return worse
+
+
+def report(results, baseline=None, worse=()):
+    print('%-26s %10s %12s %9s %8s' % (
+        'benchmark', 'MB/s', 'values/s', 'RSS MB', 'vs base'))
+    for key, result in results.items():
+        change = ''
+        if baseline and key in baseline:
+            change = '%+.0f%%' % (
+                (result['mb_per_s'] / baseline[key]['mb_per_s'] - 1) * 100)
+        print('%-26s %10.1f %12.0f %9.1f %8s%s' % (
+            key, result['mb_per_s'], result['values_per_s'],
+            result['peak_rss_mb'], change,
+            '  REGRESSION' if key in worse else ''))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('scenarios', nargs='*', metavar='scenario',
+                        help='scenarios to run, all by default: %s' %
+                        ', '.join(fixtures.SCENARIOS))
+    parser.add_argument('--save', action='store_true',
+                        help='write the results to the baseline')
+    parser.add_argument('--compare', action='store_true',
+                        help='compare the results with the baseline')
+    parser.add_argument('--baseline', metavar='FILE', default=BASELINE,
+                        help='baseline file (default %(default)s)')
+    parser.add_argument('--threshold', type=float, default=0.15,
+                        help='tolerated relative change (default 0.15)')
+    parser.add_argument('--child', nargs=3, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        print(json.dumps(run(*args.child)))
+        return 0
+
+    results = run_all(args.scenarios or list(fixtures.SCENARIOS))
+    baseline = None
+    worse = []
+    if args.compare:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        worse = regressions(results, baseline, args.threshold)
+    report(results, baseline, worse)
+    if args.save:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=1, sort_keys=True)
+            f.write('\n')
+    return 1 if worse else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
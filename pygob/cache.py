@@ -0,0 +1,75 @@
+"""Sharing decoded types between loaders.
+
+Every Loader normally decodes the type definitions at the start of each
+stream again and builds new struct classes and decode plans for them.
+A TypeCache lets loaders reuse those for streams that share a schema.
+
+A cache entry is keyed by the loader options, the concrete type names
+registered for interfaces and all definition segments seen so far, in
+order. Type ids refer to each other by number, so a single definition
+only means the same thing when every definition before it is the same
+too. Each entry holds a template loader that
+decoded exactly those definitions. Its types are never redefined, so
+loaders can adopt them, along with their compiled plans and struct
+classes, without decoding the definitions themselves.
+"""
+
+import collections
+import threading
+
+
+class TypeCache:
+    """A bounded cache of decoded stream schemas, shared by loaders.
+
+    Pass it to Loader(cache=...) or pygob.load_all(buf, cache=...):
+
+    >>> import pygob
+    >>> cache = TypeCache()
+    >>> point = bytes.fromhex('1f ff 81 03 01 01 05 50 6f 69 6e 74 01 ff 82 00'
+    ...                       '01 02 01 01 58 01 04 00 01 01 59 01 04 00 00 00'
+    ...                       '07 ff 82 01 2c 01 42 00')
+    >>> a = pygob.load(point, cache=cache)
+    >>> b = pygob.load(point, cache=cache)
+    >>> a, type(a) is type(b)
+    (Point(X=22, Y=33), True)
+    >>> cache.hits, cache.misses, len(cache)
+    (1, 1, 1)
+
+    At most maxsize schemas are kept; the least recently used is
+    dropped first.
+    """
+
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def template(self, key, build):
+        """Return the template loader cached under key, calling build()
+        to create it if there is none.
+        """
+        with self._lock:
+            template = self._entries.get(key)
+            if template is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return template
+            self.misses += 1
+        template = build()
+        with self._lock:
+            # Another thread may have built it meanwhile; keep theirs so
+            # that everyone shares the same classes.
+            template = self._entries.setdefault(key, template)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return template
@@ -0,0 +1,288 @@
+"""Decoding slices of structs into columns.
+
+load_columns decodes a slice of structs into one column per field
+instead of one record per element: NumPy arrays for fields of bools,
+ints, uints and floats, and BinaryColumns, an offsets array and a data
+buffer as Arrow lays them out, for strings and byte slices. No Python
+object is created per element for these fields. Fields of other types
+are decoded as usual into a list.
+
+Imported on demand by pygob.load_columns, so NumPy stays an optional
+dependency; pyarrow is only needed for arrow=True.
+"""
+
+from array import array
+
+import numpy
+
+from .loader import Loader
+from .projection import BaseProjection
+from .types import (BOOL, INT, UINT, FLOAT, BYTE_SLICE, STRING, GoUint,
+                    GoStruct, GoSlice, GoArray)
+
+# Array typecodes the values of fixed-width fields are collected in,
+# and the dtypes the arrays are then viewed as.
+_FIXED = {
+    BOOL: ('B', numpy.bool_),
+    INT: ('q', numpy.int64),
+    UINT: ('Q', numpy.uint64),
+    FLOAT: ('d', numpy.float64),
+}
+
+# Marks elements whose field was left out, being zero.
+_MISSING = object()
+
+
+def load_columns(buf, path='', arrow=False, **options):
+    """Decode the slice of structs at path in the first value of buf into
+    a dict of columns keyed by field name. path is a dotted path of struct
+    field names, '' for a value which is a slice itself.
+
+    >>> from typing import NamedTuple
+    >>> from pygob import Dumper
+    >>> class Depot(NamedTuple):
+    ...     Id: int
+    ...     Size: float
+    ...     Name: str
+    >>> class App(NamedTuple):
+    ...     Appid: int
+    ...     Depots: list[Depot]
+    >>> buf = Dumper().dump(App(7, [Depot(1, 2.5, 'win'), Depot(2, 0, '')]))
+    >>> columns = load_columns(buf, 'Depots')
+    >>> columns['Id'], columns['Size']
+    (array([1, 2]), array([2.5, 0. ]))
+    >>> columns['Name']
+    BinaryColumn([b'win', b''])
+    >>> columns['Name'].offsets, bytes(columns['Name'].data)
+    (array([0, 3, 3]), b'win')
+
+    Loader options are passed on; with strings='str' the string columns
+    hold text, unless one of their values is not valid UTF-8:
+
+    >>> load_columns(buf, 'Depots', strings='str')['Name']
+    BinaryColumn(['win', ''])
+    >>> buf = Dumper().dump(App(7, [Depot(1, 0, b'\\xc3'),
+    ...                             Depot(2, 0, b'\\xa9')]))
+    >>> load_columns(buf, 'Depots', strings='str')['Name']
+    BinaryColumn([b'\\xc3', b'\\xa9'])
+
+    With arrow=True a pyarrow.Table is returned instead, sharing the
+    buffers of the columns.
+    """
+    loader = Loader(**options)
+    projection = ColumnProjection(path, text=options.get('strings') == 'str')
+    columns, _ = loader._load(memoryview(buf).toreadonly(), 0, projection)
+    if arrow:
+        return to_arrow(columns)
+    return columns
+
+
+class BinaryColumn:
+    """A column of strings or byte slices. Value i is data[offsets[i]:
+    offsets[i + 1]], with offsets an int64 and data a uint8 array.
+
+    >>> column = BinaryColumn(numpy.array([0, 2, 2, 5]),
+    ...                       numpy.frombuffer(b'hiyou', numpy.uint8))
+    >>> len(column), column[2], column.tolist()
+    (3, b'you', [b'hi', b'', b'you'])
+    """
+
+    __slots__ = ('offsets', 'data', 'text')
+
+    def __init__(self, offsets, data, text=False):
+        self.offsets = offsets
+        self.data = data
+        self.text = text
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError('column index out of range')
+        value = self.data[self.offsets[i]:self.offsets[i + 1]].tobytes()
+        return value.decode('utf-8') if self.text else value
+
+    def tolist(self):
+        return [self[i] for i in range(len(self))]
+
+    def __repr__(self):
+        return 'BinaryColumn(%r)' % self.tolist()
+
+
+class ColumnProjection(BaseProjection):
+    """Decodes the slice at path into columns, like a Projection selecting
+    it would decode it into a list, see Loader._load_segment.
+    """
+
+    def __init__(self, path, text=False):
+        super().__init__()
+        self.path = path.split('.') if path else []
+        self.text = text
+
+    def compile_projector(self, loader, typeid):
+        return self._compile(loader, typeid, self.path)
+
+    def project(self, loader, typeid, buf, pos=0):
+        """Decode the columns of the typeid value at pos. Returns a dict
+        keyed by field name and the position after the value.
+        """
+        return self.projector(loader, typeid)(buf, pos)
+
+    def _compile(self, loader, typeid, path):
+        go_type = loader.types.get(typeid)
+        if not path:
+            if not (isinstance(go_type, (GoSlice, GoArray)) and
+                    isinstance(loader.types.get(go_type._elem), GoStruct)):
+                raise ValueError('not a slice or array of structs: %s' %
+                                 typeid)
+            return _compile_columns(loader, loader.types[go_type._elem],
+                                    self.text)
+        if not isinstance(go_type, GoStruct):
+            raise ValueError('no field %r in %s' % (path[0], typeid))
+        names = [name for name, _ in go_type._fields]
+        if path[0] not in names:
+            raise ValueError('no field %r in %s' % (path[0], typeid))
+        selected = names.index(path[0])
+        project_field = self._compile(loader, go_type._fields[selected][1],
+                                      path[1:])
+        skips = [loader.skipper(t) for _, t in go_type._fields]
+
+        def project(buf, pos):
+            result = None
+            field_id = -1
+            while True:
+                delta, pos = GoUint.decode(buf, pos)
+                if delta == 0:
+                    break
+                field_id += delta
+                if field_id == selected:
+                    result, pos = project_field(buf, pos)
+                else:
+                    pos = skips[field_id](buf, pos)
+            if result is None:
+                # Go leaves out empty slices: no rows.
+                result, _ = project_field(GoUint.encode(0), 0)
+            return result, pos
+        return project
+
+
+def _compile_columns(loader, struct, text):
+    """Return a function decoding a slice or array of struct values into
+    columns, called as project(buf, pos) and returning (columns, pos).
+    """
+    fields = struct._fields
+
+    def project(buf, pos):
+        count, pos = GoUint.decode(buf, pos)
+        stores = []
+        finishers = []
+        for index, (_, typeid) in enumerate(fields):
+            store, finish = _column(loader, struct, index, typeid, count,
+                                    text)
+            stores.append(store)
+            finishers.append(finish)
+
+        decode_uint = GoUint.decode
+        for i in range(count):
+            field_id = -1
+            while True:
+                delta, pos = decode_uint(buf, pos)
+                if delta == 0:
+                    break
+                field_id += delta
+                pos = stores[field_id](buf, pos, i)
+        return {name: finish()
+                for (name, _), finish in zip(fields, finishers)}, pos
+    return project
+
+
+def _column(loader, struct, index, typeid, count, text):
+    """Return the functions filling one column: store(buf, pos, i) decodes
+    the value of element i at pos and returns the position after it, and
+    finish() returns the column once every element has been stored.
+    """
+    if typeid in _FIXED:
+        typecode, dtype = _FIXED[typeid]
+        # Zero for the elements where Go leaves the field out.
+        values = array(typecode, [0]) * count
+        decode = loader.types[typeid].decode
+
+        def store(buf, pos, i):
+            values[i], pos = decode(buf, pos)
+            return pos
+
+        def finish():
+            return numpy.frombuffer(values, dtype) if count else (
+                numpy.zeros(0, dtype))
+        return store, finish
+
+    if typeid in (STRING, BYTE_SLICE):
+        # Offsets of elements whose field is left out are filled in from
+        # the ones before, see finish().
+        offsets = array('q', [-1]) * (count + 1)
+        offsets[0] = 0
+        data = bytearray()
+        decode_uint = GoUint.decode
+
+        def store(buf, pos, i):
+            length, pos = decode_uint(buf, pos)
+            end = pos + length
+            data.extend(buf[pos:end])
+            offsets[i + 1] = len(data)
+            return end
+
+        def finish():
+            ends = numpy.maximum.accumulate(numpy.frombuffer(offsets,
+                                                             numpy.int64))
+            raw = numpy.frombuffer(data, numpy.uint8)
+            is_text = text and typeid == STRING
+            if is_text:
+                # Like Loader(strings='str'), fall back to bytes. Every
+                # value is valid UTF-8 if all of them together are and
+                # none starts with a continuation byte, within a
+                # character split between values.
+                starts = ends[:-1]
+                starts = starts[starts < len(raw)]
+                try:
+                    data.decode('utf-8')
+                except UnicodeDecodeError:
+                    is_text = False
+                else:
+                    is_text = not ((raw[starts] & 0xc0) == 0x80).any()
+            return BinaryColumn(ends, raw, is_text)
+        return store, finish
+
+    values = [_MISSING] * count
+    decode = loader.decoder(typeid)
+
+    def store(buf, pos, i):
+        values[i], pos = decode(buf, pos)
+        return pos
+
+    def finish():
+        for i, value in enumerate(values):
+            if value is _MISSING:
+                values[i] = struct.field_zero(index)
+        return values
+    return store, finish
+
+
+def to_arrow(columns):
+    """Return a pyarrow.Table of columns as returned by load_columns.
+    Numeric and binary columns are wrapped without copying."""
+    import pyarrow
+
+    arrays = {}
+    for name, column in columns.items():
+        if isinstance(column, BinaryColumn):
+            kind = (pyarrow.large_string() if column.text else
+                    pyarrow.large_binary())
+            arrays[name] = pyarrow.Array.from_buffers(
+                kind, len(column), [None, pyarrow.py_buffer(column.offsets),
+                                    pyarrow.py_buffer(column.data)])
+        else:
+            arrays[name] = pyarrow.array(column)
+    return pyarrow.table(arrays)
@@ -0,0 +1,303 @@
+"""Ahead-of-time compilation of struct decoders.
+
+    python -m pygob.compile schema.gob -o decoders.py
+
+reads the type definitions of a gob stream and writes a Python module
+with one straight-line decode function per struct: the field deltas
+are unrolled into a chain of tests, one per field in order, and ints,
+uints, floats, bools, strings and byte slices are decoded inline
+instead of through a call per field. Other fields call the decoder the
+loader has for their type.
+
+Loader(compiled=module) then takes the types of every definition that
+is byte for byte the same as one in the module from the module, without
+decoding the wire type, and decodes their structs with the generated
+functions. Other definitions are decoded as usual, so a stream whose
+schema has changed still decodes, only more slowly.
+"""
+
+import argparse
+import sys
+from functools import partial
+
+from .loader import Loader, scan_segments
+from .types import (BOOL, INT, UINT, FLOAT, BYTE_SLICE, STRING,
+                    GoBool, GoInt, GoUint, GoFloat, GoByteSlice, GoString,
+                    GoStruct, GoSlice, GoArray, GoMap)
+
+# Version of the generated modules, checked when they are loaded.
+FORMAT = 1
+
+# The decoders the generated code inlines. Loaders decoding these types
+# differently, such as Loader(copy=False), use the generic decoder.
+INLINED = {
+    BOOL: GoBool.decode,
+    INT: GoInt.decode,
+    UINT: GoUint.decode,
+    FLOAT: GoFloat.decode,
+    BYTE_SLICE: GoByteSlice.decode,
+    STRING: GoString.decode,
+}
+
+HEADER = '''\
+"""Struct decoders for the types defined in %(source)s.
+
+Generated by python -m pygob.compile; do not edit. Pass this module to
+Loader(compiled=...).
+"""
+
+from struct import Struct
+
+FORMAT = %(format)d
+
+_from_bytes = int.from_bytes
+_pack_uint64 = Struct('>Q').pack
+_unpack_float64 = Struct('<d').unpack
+'''
+
+
+class CompiledStruct(GoStruct):
+    """A GoStruct decoded by a generated function, see pygob.compile."""
+
+    def __init__(self, typeid, name, loader, fields, factory):
+        super().__init__(typeid, name, loader, fields)
+        self._factory = factory
+        self._decode = None
+        self._binding = False
+
+    def invalidate(self):
+        super().invalidate()
+        self._decode = None
+
+    @property
+    def decode(self):
+        """The generated decode function, bound to the loader's decoders
+        on first use."""
+        decode = self._decode
+        if decode is None:
+            decode = self._bind()
+        return decode
+
+    def _bind(self):
+        if self._binding:
+            # A recursive struct asks for its own decoder while it is
+            # being bound.
+            return lambda buf, pos=0: self.decode(buf, pos)
+        loader = self._loader
+        if any(loader.decoder(typeid) is not INLINED[typeid]
+               for _, typeid in self._fields if typeid in INLINED):
+            decode = partial(GoStruct.decode, self)
+        else:
+            if self._loader._record == 'namedtuple':
+                make = partial(tuple.__new__, self._class)
+            else:
+                make = self._make
+            self._binding = True
+            try:
+                decode = self._factory(loader, self, make)
+            finally:
+                self._binding = False
+        self._decode = decode
+        loader.compiled(self)
+        return decode
+
+
+class CompiledSchema:
+    """The types of a module generated by pygob.compile, given as the
+    module or its name.
+    """
+
+    def __init__(self, module):
+        if isinstance(module, str):
+            import importlib
+            module = importlib.import_module(module)
+        if getattr(module, 'FORMAT', None) != FORMAT:
+            raise ValueError('%s was not generated by this version of '
+                             'pygob.compile' % module.__name__)
+        self._definitions = module.DEFINITIONS
+        self._types = module.TYPES
+        self._decoders = module.DECODERS
+
+    def build(self, loader, typeid, segment):
+        """Return the type defined by segment for loader, or None if the
+        definition is not the one the module was generated for.
+        """
+        if self._definitions.get(typeid) != segment:
+            return None
+        kind, *args = self._types[typeid]
+        if kind == 'struct':
+            name, fields = args
+            return CompiledStruct(typeid, name, loader, list(fields),
+                                  self._decoders[typeid])
+        if kind == 'slice':
+            return GoSlice(typeid, loader, *args)
+        if kind == 'array':
+            return GoArray(typeid, loader, *args)
+        if kind == 'map':
+            return GoMap(typeid, loader, *args)
+        return None
+
+
+def definitions(buf):
+    """Return the definition segments of the stream in buf and the types
+    they define, keyed by type id. Values are skipped.
+    """
+    loader = Loader()
+    buf = memoryview(buf).toreadonly()
+    segments = {}
+    for start, _, typeid in scan_segments(buf):
+        if typeid < 0:
+            # A redefined type id keeps its last definition.
+            segment = loader._read_segment(buf, start)[0]
+            loader._load_segment(segment)
+            segments[-typeid] = bytes(segment)
+    return segments, {typeid: loader.types[typeid] for typeid in segments}
+
+
+def generate(buf, source='<stream>'):
+    """Return the source of the decoder module for the types defined in
+    the stream in buf.
+
+    >>> from pygob import Dumper
+    >>> from typing import NamedTuple
+    >>> class Point(NamedTuple):
+    ...     X: int
+    ...     Y: int
+    >>> namespace = {}
+    >>> exec(generate(Dumper().dump(Point(1, 2))), namespace)
+    >>> namespace['TYPES']
+    {64: ('struct', 'Point', (('X', 2), ('Y', 2)))}
+    """
+    segments, types = definitions(buf)
+    lines = [HEADER % {'source': source, 'format': FORMAT}]
+    lines.append('DEFINITIONS = {')
+    for typeid, segment in segments.items():
+        lines.append('    %d: %r,' % (typeid, segment))
+    lines.append('}')
+    lines.append('')
+    lines.append('TYPES = {')
+    for typeid, go_type in types.items():
+        description = _describe(go_type)
+        if description is not None:
+            lines.append('    %d: %r,' % (typeid, description))
+    lines.append('}')
+    structs = [go_type for go_type in types.values()
+               if type(go_type) is GoStruct]
+    for go_type in structs:
+        lines.append('')
+        lines.append('')
+        lines.extend(_struct_decoder(go_type))
+    lines.append('')
+    lines.append('')
+    lines.append('DECODERS = {')
+    for go_type in structs:
+        lines.append('    %d: make_%d,' % (go_type.typeid, go_type.typeid))
+    lines.append('}')
+    return '\n'.join(lines) + '\n'
+
+
+def _describe(go_type):
+    """Return the entry of go_type in TYPES, or None for types that are
+    decoded from their definition."""
+    if type(go_type) is GoStruct:
+        return ('struct', go_type._name, tuple(go_type._fields))
+    if type(go_type) is GoSlice:
+        return ('slice', go_type._elem)
+    if type(go_type) is GoArray:
+        return ('array', go_type._elem, go_type._length)
+    if type(go_type) is GoMap:
+        return ('map', go_type._key_typeid, go_type._elem_typeid)
+    return None
+
+
+def _read_uint(name, indent):
+    """Lines reading an unsigned integer at pos into name."""
+    return [indent + line for line in (
+        '%s = buf[pos]' % name,
+        'if %s < 128:' % name,
+        '    pos += 1',
+        'else:',
+        '    end = pos + 257 - %s' % name,
+        '    %s = _from_bytes(buf[pos + 1:end], \'big\')' % name,
+        '    pos = end',
+    )]
+
+
+# Lines decoding a field of the inlined types into v from the unsigned
+# integer u read before them.
+_INLINE = {
+    BOOL: ['v = u == 1'],
+    INT: ['v = ~u >> 1 if u & 1 else u >> 1'],
+    UINT: ['v = u'],
+    FLOAT: ['v = _unpack_float64(_pack_uint64(u))[0]'],
+    BYTE_SLICE: ['end = pos + u', 'v = bytearray(buf[pos:end])',
+                 'pos = end'],
+    STRING: ['end = pos + u', 'v = bytes(buf[pos:end])', 'pos = end'],
+}
+
+# Zero values of the inlined types that are immutable.
+_ZEROS = {BOOL: 'False', INT: '0', UINT: '0', FLOAT: '0.0', STRING: "b''"}
+
+
+def _struct_decoder(go_type):
+    """Lines of the factory binding the decode function of go_type."""
+    fields = go_type._fields
+    end = len(fields)
+    lines = [
+        'def make_%d(loader, go_type, make):' % go_type.typeid,
+        '    """%s"""' % (go_type._name or 'struct'),
+        '    zero = go_type.field_zero',
+    ]
+    for index, (_, typeid) in enumerate(fields):
+        if typeid not in _INLINE:
+            lines.append('    decode_%d = loader.decoder(%d)' % (index, typeid))
+    lines.append('')
+    lines.append('    def decode(buf, pos=0):')
+    for index, (_, typeid) in enumerate(fields):
+        lines.append('        v%d = %s' % (index, _ZEROS.get(typeid, 'None')))
+    lines.extend(_read_uint('d', '        '))
+    lines.append('        f = d - 1 if d else %d' % end)
+    for index, (name, typeid) in enumerate(fields):
+        lines.append('        if f == %d:  # %s' % (index, name))
+        if typeid in _INLINE:
+            lines.extend(_read_uint('u', '            '))
+            lines.extend('            ' + line.replace('v', 'v%d' % index, 1)
+                         for line in _INLINE[typeid])
+        else:
+            lines.append('            v%d, pos = decode_%d(buf, pos)' %
+                         (index, index))
+        lines.extend(_read_uint('d', '            '))
+        lines.append('            f = f + d if d else %d' % end)
+    lines.append("        assert f == %d, 'unknown field %%d' %% f" % end)
+    for index, (_, typeid) in enumerate(fields):
+        if typeid not in _ZEROS:
+            # Go leaves out zero fields; mutable zeros are made anew.
+            lines.append('        if v%d is None:' % index)
+            lines.append('            v%d = zero(%d)' % (index, index))
+    values = ', '.join('v%d' % index for index in range(len(fields)))
+    if len(fields) == 1:
+        values += ','
+    lines.append('        return make((%s)), pos' % values)
+    lines.append('    return decode')
+    return lines
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('schema', help='gob stream defining the types')
+    parser.add_argument('-o', '--output', metavar='FILE',
+                        help='module to write, standard output by default')
+    args = parser.parse_args(argv)
+
+    with open(args.schema, 'rb') as f:
+        source = generate(f.read(), args.schema)
+    if args.output is None:
+        sys.stdout.write(source)
+    else:
+        with open(args.output, 'w') as f:
+            f.write(source)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
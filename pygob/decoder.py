@@ -0,0 +1,114 @@
+from .loader import Loader
+from .types import GoUint, _Continued
+
+
+class Decoder:
+    """A push-style gob decoder.
+
+    Feed it the stream in chunks of any size as they arrive; each call
+    to feed returns the values completed so far. Only the incomplete
+    tail of the stream is buffered, so memory is bounded by the largest
+    single segment rather than by the whole stream:
+
+    >>> decoder = Decoder()
+    >>> decoder.feed(bytes([3, 4, 0]))
+    []
+    >>> decoder.feed(bytes([6, 3, 4, 0]))
+    [3]
+    >>> decoder.feed(bytes([7]))
+    [-4]
+    """
+
+    def __init__(self, loader=None):
+        if loader is None:
+            loader = Loader()
+        self.loader = loader
+        self._buffer = bytearray()
+
+    @property
+    def pending(self):
+        """Number of buffered bytes belonging to an incomplete segment."""
+        return len(self._buffer)
+
+    def feed(self, chunk):
+        """Add chunk to the stream and return a list of the values it
+        completed.
+
+        If a segment cannot be decoded, the error is raised and the
+        segment is dropped along with the ones decoded before it, so the
+        next call goes on after it:
+
+        >>> decoder = Decoder()
+        >>> decoder.feed(bytes([3, 4, 0, 6, 4, 0xff, 0x80, 0, 2]))
+        Traceback (most recent call last):
+        ...
+        NotImplementedError: cannot decode 64
+        >>> decoder.feed(bytes([3, 4, 0, 7]))
+        [-4]
+        """
+        buf = self._buffer
+        buf += chunk
+        values = []
+        pos = 0
+
+        def more():
+            # The value goes on in the next segment, see GoInterface.
+            nonlocal pos
+            extent = _segment(buf, pos)
+            if extent is None:
+                raise _Incomplete()
+            start, pos = pos, extent[1]
+            return buf[start:pos]
+
+        try:
+            while True:
+                extent = _segment(buf, pos)
+                if extent is None:
+                    break
+                # Slicing copies the segment out of the buffer, which
+                # keeps the buffer resizable.
+                segment = memoryview(buf[extent[0]:extent[1]]).toreadonly()
+                first, pos = pos, extent[1]
+                try:
+                    try:
+                        found, value = self.loader._load_segment(segment)
+                    except _Continued:
+                        found, value = self.loader._load_continued(segment,
+                                                                   more)
+                except _Incomplete:
+                    # It is decoded again once the rest has arrived.
+                    pos = first
+                    break
+                if found:
+                    values.append(value)
+        finally:
+            del buf[:pos]
+        return values
+
+    def close(self):
+        """Signal the end of the stream. Raises EOFError if it stopped in
+        the middle of a segment.
+        """
+        if self._buffer:
+            raise EOFError('truncated segment: %d bytes left over' %
+                           len(self._buffer))
+
+
+class _Incomplete(Exception):
+    """Raised when a value goes on in a segment not fed yet."""
+
+
+def _segment(buf, pos):
+    """Return the (start, end) of the contents of the segment at pos in
+    buf, or None if it is incomplete.
+    """
+    if pos >= len(buf):
+        return None
+    head = buf[pos]
+    start = pos + 1 if head < 128 else pos + 257 - head
+    if start > len(buf):
+        return None  # length prefix is incomplete
+    length, start = GoUint.decode(buf, pos)
+    if start + length > len(buf):
+        return None  # segment is incomplete
+    return start, start + length
@@ -1,35 +1,420 @@
-import io
-
+from .types import (BOOL, INT, UINT, FLOAT, BYTE_SLICE, STRING, COMPLEX,
+                    INTERFACE, WIRE_TYPE, ARRAY_TYPE, COMMON_TYPE,
+                    SLICE_TYPE, STRUCT_TYPE, FIELD_TYPE, MAP_TYPE)
 from .types import (GoBool, GoInt, GoUint, GoFloat, GoStruct, GoByteSlice,
-                    GoString, GoComplex)
+                    GoString, GoComplex, GoArray, GoSlice, GoMap)
+from .encoder import Encoder
+from .lazy import LazyStruct
+
+# Go numbers the types it defines in a stream from 64 onwards.
+FIRST_CUSTOM_TYPEID = 64
+
+# Go's spelling of the basic types, from which composite types are
+# spelled.
+TYPE_NAMES = {
+    BOOL: 'bool',
+    INT: 'int',
+    UINT: 'uint',
+    FLOAT: 'float64',
+    BYTE_SLICE: '[]uint8',
+    STRING: 'string',
+    COMPLEX: 'complex128',
+    INTERFACE: 'interface',
+}
+
+# How Go names a type it defines depends on where it first meets it.
+# Struct fields name composite types by their spelling, such as
+# '[]main.Inner'; elsewhere they are unnamed. Structs are named after
+# their class, except as array elements or map keys and elements.
+NAMED, SPELLED, UNNAMED = range(3)
+
+# Room left for the length of a segment before it is encoded, enough
+# for any uint.
+SPACE_FOR_LENGTH = bytes(9)
 
 
 class Dumper:
-    def __init__(self, types=None):
+    """Encodes Python values as a gob stream.
+
+    Type definitions are sent the first time a type is used, so
+    successive dumps from one Dumper form a single stream. The types of
+    namedtuples and dataclasses come from their annotations if present
+    and otherwise from the values first dumped:
+
+    >>> import collections
+    >>> Point = collections.namedtuple('Point', ['X', 'Y'])
+    >>> dumper = Dumper()
+    >>> dumper.dump(Point(22, 33)).hex(' ')
+    '1e 7f 03 01 01 05 50 6f 69 6e 74 01 ff 80 00 01 02 01 01 58 01 04 00 01 01 59 01 04 00 00 00 07 ff 80 01 2c 01 42 00'
+    >>> dumper.dump(Point(1, 0)).hex(' ')
+    '05 ff 80 01 02 00'
+
+    This is byte for byte what Go's encoding/gob sends for a
+    struct{X, Y int}, see dump(), and it loads back as expected:
+
+    >>> from pygob import Loader
+    >>> Loader().load(Dumper().dump([Point(1, 2), Point(3, 4)]))
+    [Point(X=1, Y=2), Point(X=3, Y=4)]
+
+    Bytes are sent as Go byte slices. Fields annotated str take bytes as
+    well, such as the strings Loader decodes, and send them as strings:
+
+    >>> from typing import NamedTuple
+    >>> class File(NamedTuple):
+    ...     Name: str
+    ...     Data: bytes
+    >>> Loader().load(Dumper().dump(File(b'a.txt', b'hi')))
+    File(Name=b'a.txt', Data=bytearray(b'hi'))
+
+    NumPy arrays are sent as slices, and NumPy scalars as the Python
+    numbers they stand for:
+
+    >>> import numpy
+    >>> Loader().load(Dumper().dump(Point(numpy.int64(1), numpy.float64(2))))
+    Point(X=1, Y=2.0)
+    """
+
+    def __init__(self, types=None, package='main'):
+        # Bytes are sent as []byte, as they always were. Fields
+        # annotated str also take bytes, such as the Go strings Loader
+        # decodes, see GoString.encode.
         self.types = {
             bool: GoBool,
             int: GoInt,
             float: GoFloat,
             bytes: GoByteSlice,
+            bytearray: GoByteSlice,
+            memoryview: GoByteSlice,
             str: GoString,
             complex: GoComplex,
         }
+        if types is not None:
+            self.types.update(types)
+
+        # The loader holds the structs describing wire types.
+        from .loader import Loader
+        self._wire_types = Loader().types
+        self._encoder = Encoder(dict(self._wire_types))
+
+        # Slices, arrays and maps by (kind, element typeids...).
+        self._composites = {}
+        # The names sent in definitions, and Go's spelling of every type,
+        # in which structs are qualified by package.
+        self._names = {}
+        self._spellings = dict(TYPE_NAMES)
+        self._package = package
+        self._next_typeid = FIRST_CUSTOM_TYPEID
+        # Types created for the value being dumped, whose definitions
+        # still have to be sent, as (registry, key, go_type).
+        self._pending = []
 
     def dump(self, value):
+        """Return the segments for value: definitions of the types it uses
+        that have not been sent yet, then the value itself.
+
+        Types are numbered, named and sent in the order Go's encoding/gob
+        uses, so a fresh Dumper writes what a fresh gob.Encoder writes
+        for the same value. These are the bytes Go 1.21 writes for a
+        slice, a map and an array:
+
+        >>> Dumper().dump([1, 2, 3]).hex(' ')
+        '0b 7f 02 01 02 ff 80 00 01 04 00 00 07 ff 80 00 03 02 04 06'
+        >>> Dumper().dump({'a': 1}).hex(' ')
+        '0d 7f 04 01 02 ff 80 00 01 0c 01 04 00 00 07 ff 80 00 01 01 61 02'
+        >>> Dumper().dump((1, -2, 3)).hex(' ')
+        '0d 7f 01 01 02 ff 80 00 01 04 01 06 00 00 07 ff 80 00 03 02 03 06'
+
+        for a []Point and a map[string]Point, with type Point struct{X,
+        Y int}:
+
+        >>> from typing import NamedTuple
+        >>> class Point(NamedTuple):
+        ...     X: int
+        ...     Y: int
+        >>> Dumper().dump([Point(1, 2), Point(3, 4)]) == bytes.fromhex(
+        ...     '0d ff 81 02 01 02 ff 82 00 01 ff 80 00 00 1e 7f 03 01 01 05'
+        ...     '50 6f 69 6e 74 01 ff 80 00 01 02 01 01 58 01 04 00 01 01 59'
+        ...     '01 04 00 00 00 0e ff 82 00 02 01 02 01 04 00 01 06 01 08 00')
+        True
+        >>> Dumper().dump({'p': Point(1, 2)}) == bytes.fromhex(
+        ...     '0f ff 81 04 01 02 ff 82 00 01 0c 01 ff 80 00 00 17 7f 03 01'
+        ...     '02 ff 80 00 01 02 01 01 58 01 04 00 01 01 59 01 04 00 00 00'
+        ...     '0b ff 82 00 01 01 70 01 02 01 04 00')
+        True
+
+        and for nested structs, with type Inner struct{A int; B string}
+        and type Outer struct{Name string; Inner Inner; Items []Inner;
+        Tags map[string]int; Data []byte}, in package main:
+
+        >>> class Inner(NamedTuple):
+        ...     A: int
+        ...     B: str
+        >>> class Outer(NamedTuple):
+        ...     Name: str
+        ...     Inner: Inner
+        ...     Items: list[Inner]
+        ...     Tags: dict[str, int]
+        ...     Data: bytes
+        >>> outer = Outer('x', Inner(1, 'y'), [Inner(2, 'z'), Inner(0, '')],
+        ...               {'k': 7}, b'hi')
+        >>> Dumper().dump(outer) == bytes.fromhex(
+        ...     '44 7f 03 01 01 05 4f 75 74 65 72 01 ff 80 00 01 05 01 04 4e'
+        ...     '61 6d 65 01 0c 00 01 05 49 6e 6e 65 72 01 ff 82 00 01 05 49'
+        ...     '74 65 6d 73 01 ff 84 00 01 04 54 61 67 73 01 ff 86 00 01 04'
+        ...     '44 61 74 61 01 0a 00 00 00 1f ff 81 03 01 01 05 49 6e 6e 65'
+        ...     '72 01 ff 82 00 01 02 01 01 41 01 04 00 01 01 42 01 0c 00 00'
+        ...     '00 1b ff 83 02 01 01 0c 5b 5d 6d 61 69 6e 2e 49 6e 6e 65 72'
+        ...     '01 ff 84 00 01 ff 82 00 00 1e ff 85 04 01 01 0e 6d 61 70 5b'
+        ...     '73 74 72 69 6e 67 5d 69 6e 74 01 ff 86 00 01 0c 01 04 00 00'
+        ...     '1f ff 80 01 01 78 01 01 02 01 01 79 00 01 02 01 04 01 01 7a'
+        ...     '00 00 01 01 01 6b 0e 01 02 68 69 00')
+        True
+
+        Structs are qualified by package in the names Go gives composite
+        types of struct fields, such as '[]main.Inner' above; pass the Go
+        package as Dumper(package=...).
+        """
         return self._dump(value)
 
     def _dump(self, value):
-        # Top-level singletons are sent with an extra zero byte which
-        # serves as a kind of field delta.
+        out = bytearray()
+        self._dump_into(out, value)
+        return bytes(out)
+
+    def _dump_into(self, out, value):
+        """Append the segments for value to out: definitions of the types
+        it uses that have not been sent yet, then the value itself.
+        """
+        start = len(out)
+        try:
+            typeid = self._typeid(value)
+            self._define_pending(out, typeid)
+
+            segment = len(out)
+            out += SPACE_FOR_LENGTH
+            self._encoder.encode(typeid, value, out)
+            _finish_segment(out, segment)
+        except Exception:
+            # Take back what was appended and forget the types of the
+            # value, their definitions were never sent.
+            del out[start:]
+            for registry, key, go_type in self._pending:
+                del registry[key]
+                del self._encoder.types[go_type.typeid]
+            self._pending = []
+            raise
+        self._pending = []
+
+    def _define_pending(self, out, typeid):
+        """Append the definitions of the new types of a typeid value to
+        out in the order Go sends them: every type before the types it is
+        made of, which follow it depth first.
+        """
+        pending = {go_type.typeid: go_type for _, _, go_type in self._pending}
+        stack = [typeid]
+        while stack:
+            go_type = pending.pop(stack.pop(), None)
+            if go_type is None:
+                continue
+            self._define(out, go_type)
+            if isinstance(go_type, GoStruct):
+                parts = [field_typeid for _, field_typeid in go_type._fields]
+            elif isinstance(go_type, GoMap):
+                parts = [go_type._key_typeid, go_type._elem_typeid]
+            else:
+                parts = [go_type._elem]
+            stack.extend(reversed(parts))
+
+    def _define(self, out, go_type):
+        """Append the segment defining go_type to out."""
+        types = self._wire_types
+        typeid = go_type.typeid
+        common = types[COMMON_TYPE]._class(self._names[typeid], typeid)
+        if isinstance(go_type, GoStruct):
+            field_type = types[FIELD_TYPE]._class
+            fields = [field_type(name, id_) for name, id_ in go_type._fields]
+            wire = {'StructT': types[STRUCT_TYPE]._class(common, fields)}
+        elif isinstance(go_type, GoSlice):
+            wire = {'SliceT': types[SLICE_TYPE]._class(common, go_type._elem)}
+        elif isinstance(go_type, GoArray):
+            wire = {'ArrayT': types[ARRAY_TYPE]._class(
+                common, go_type._elem, go_type._length)}
+        else:
+            wire = {'MapT': types[MAP_TYPE]._class(
+                common, go_type._key_typeid, go_type._elem_typeid)}
+
+        start = len(out)
+        out += SPACE_FOR_LENGTH
+        out += GoInt.encode(-typeid)
+        types[WIRE_TYPE].encode_into(out, wire)
+        _finish_segment(out, start)
+
+    def _typeid(self, value, naming=NAMED):
+        """Return the typeid to encode value with, creating types for
+        values of a new shape, named as naming says.
+        """
         python_type = type(value)
         go_type = self.types.get(python_type)
-        if go_type is None:
-            raise NotImplementedError("cannot encode %s of type %s" %
-                                      (value, python_type))
-
-        segment = io.BytesIO()
-        segment.write(GoInt.encode(go_type.typeid))
-        if not isinstance(go_type, GoStruct):
-            segment.write(b'\x00')
-        segment.write(go_type.encode(value))
-        return GoUint.encode(segment.tell()) + segment.getvalue()
+        if go_type is not None:
+            return go_type.typeid
+        if _is_record(python_type):
+            return self._struct(python_type, value, naming).typeid
+        if python_type is LazyStruct:
+            # Encoded like the record it stands for, field by field.
+            return self._struct(value._type._class, value, naming).typeid
+        if python_type.__module__ == 'numpy':
+            import numpy
+            if isinstance(value, numpy.generic):
+                # NumPy scalars are sent like the Python numbers they
+                # stand for.
+                return self._typeid(value.item())
+            if isinstance(value, numpy.ndarray):
+                from . import ndarray
+                return self._composite(GoSlice, ndarray.element_typeid(
+                    value.dtype), naming=naming)
+        if isinstance(value, (list, tuple, dict)):
+            if not value:
+                raise NotImplementedError(
+                    "cannot infer the element type of an empty %s" %
+                    python_type.__name__)
+            if isinstance(value, list):
+                return self._composite(GoSlice, self._typeid(value[0]),
+                                       naming=naming)
+            if isinstance(value, tuple):
+                return self._composite(
+                    GoArray, self._typeid(value[0], UNNAMED), len(value),
+                    naming=naming)
+            key, elem = next(iter(value.items()))
+            return self._composite(GoMap, self._typeid(key, UNNAMED),
+                                   self._typeid(elem, UNNAMED), naming=naming)
+        raise NotImplementedError("cannot encode %s of type %s" %
+                                  (value, python_type))
+
+    def _hinted_typeid(self, hint, naming=NAMED):
+        """Return the typeid for a type annotation, or None if it does not
+        say enough.
+        """
+        # Imported here as they are slow to import and only needed for
+        # records and annotations.
+        import collections.abc
+        import typing
+
+        origin = typing.get_origin(hint)
+        args = [arg for arg in typing.get_args(hint) if arg is not type(None)]
+        if origin is typing.Union:  # Optional[...]
+            if len(args) == 1:
+                return self._hinted_typeid(args[0], naming)
+            return None
+        if hint in self.types:
+            return self.types[hint].typeid
+        if isinstance(hint, type) and _is_record(hint):
+            return self._struct(hint, None, naming).typeid
+        sliced = (origin in (list, collections.abc.Sequence) or
+                  (origin is tuple and Ellipsis in args))
+        elem_hints = [self._hinted_typeid(arg, NAMED if sliced else UNNAMED)
+                      for arg in args if arg is not Ellipsis]
+        if not elem_hints or None in elem_hints:
+            return None
+        if sliced:
+            return self._composite(GoSlice, elem_hints[0], naming=naming)
+        if origin is tuple and len(set(elem_hints)) == 1:
+            return self._composite(GoArray, elem_hints[0], len(args),
+                                   naming=naming)
+        if origin in (dict, collections.abc.Mapping) and len(args) == 2:
+            return self._composite(GoMap, *elem_hints, naming=naming)
+        return None
+
+    def _struct(self, cls, value, naming=NAMED):
+        """Return the GoStruct for the namedtuple or dataclass cls. The
+        types of fields without annotations are taken from value.
+        """
+        go_type = self.types.get(cls)
+        if go_type is not None:
+            return go_type
+
+        import dataclasses
+        import typing
+
+        if dataclasses.is_dataclass(cls):
+            names = [f.name for f in dataclasses.fields(cls)]
+        else:
+            names = list(cls._fields)
+        try:
+            hints = typing.get_type_hints(cls)
+        except Exception:
+            hints = {}
+
+        # Register the struct before its fields so that recursive
+        # types refer to it.
+        fields = [(name, None) for name in names]
+        typeid = self._new_typeid(
+            '' if naming == UNNAMED else cls.__name__,
+            '%s.%s' % (self._package, cls.__name__))
+        go_type = GoStruct(typeid, cls.__name__, self._encoder, fields)
+        self.types[cls] = go_type
+        self._pending.append((self.types, cls, go_type))
+
+        for index, name in enumerate(names):
+            field_typeid = None
+            if name in hints:
+                field_typeid = self._hinted_typeid(hints[name], SPELLED)
+            if field_typeid is None and value is not None:
+                field_value = getattr(value, name)
+                if field_value is not None:
+                    field_typeid = self._typeid(field_value, SPELLED)
+            if field_typeid is None:
+                raise NotImplementedError(
+                    "cannot infer the type of field %s of %s, "
+                    "annotate it" % (name, cls.__name__))
+            fields[index] = (name, field_typeid)
+        return go_type
+
+    def _composite(self, cls, *elems, naming=NAMED):
+        """Return the typeid of a GoSlice, GoArray or GoMap with the given
+        element typeids (and length for arrays).
+        """
+        key = (cls, ) + elems
+        go_type = self._composites.get(key)
+        if go_type is not None:
+            return go_type.typeid
+
+        spellings = self._spellings
+        if cls is GoSlice:
+            spelling = '[]%s' % spellings[elems[0]]
+        elif cls is GoArray:
+            spelling = '[%d]%s' % (elems[1], spellings[elems[0]])
+        else:
+            spelling = 'map[%s]%s' % (spellings[elems[0]], spellings[elems[1]])
+        typeid = self._new_typeid(spelling if naming == SPELLED else '',
+                                  spelling)
+        go_type = cls(typeid, self._encoder, *elems)
+        self._encoder.types[typeid] = go_type
+        self._composites[key] = go_type
+        self._pending.append((self._composites, key, go_type))
+        return typeid
+
+    def _new_typeid(self, name, spelling):
+        typeid = self._next_typeid
+        self._next_typeid += 1
+        self._names[typeid] = name
+        self._spellings[typeid] = spelling
+        return typeid
+
+
+def _is_record(cls):
+    """Check if cls is a namedtuple, dataclass or decoded slots record,
+    which map to structs. Dataclasses are recognized like
+    dataclasses.is_dataclass does, without importing the module.
+    """
+    return ((issubclass(cls, tuple) and hasattr(cls, '_fields')) or
+            hasattr(cls, '__dataclass_fields__') or
+            (isinstance(getattr(cls, '_fields', None), tuple) and
+             getattr(cls, '__slots__', None) == cls._fields))
+
+
+def _finish_segment(out, start):
+    """Replace the space left at start by the length of the segment that
+    follows it.
+    """
+    length = len(out) - start - len(SPACE_FOR_LENGTH)
+    out[start:start + len(SPACE_FOR_LENGTH)] = GoUint.encode(length)
@@ -1,18 +1,35 @@
-from .types import (BOOL, INT, UINT, FLOAT, BYTE_SLICE, STRING, COMPLEX,
-                    WIRE_TYPE, ARRAY_TYPE, COMMON_TYPE, SLICE_TYPE,
-                    STRUCT_TYPE, FIELD_TYPE, FIELD_TYPE_SLICE, MAP_TYPE,
-                    GOB_ENCODER_TYPE, BINARY_MARSHALER_TYPE, TEXT_MARSHALER_TYPE)
-from .types import (GoBool, GoUint, GoInt, GoFloat, GoByteSlice, GoString,
-                    GoComplex, GoStruct, GoWireType, GoSlice)
+from .types import GoInt, GoStruct, appender
+
 
 class Encoder:
+    """Encodes values of types that are already known by typeid.
+
+    types maps typeids to GoTypes, like Loader.types does.
+    """
+
     def __init__(self, types):
         self.types = types
 
-    def encode(self, typeid):
-        return self._encode(typeid)
+    def encode(self, typeid, value, out=None):
+        """Encode value as a value segment of type typeid, without its
+        length prefix. The segment is appended to the bytearray out if
+        given:
+
+        >>> from pygob import Loader
+        >>> list(Encoder(Loader().types).encode(2, 3))
+        [4, 0, 6]
+        """
+        if out is None:
+            out = bytearray()
+        self._encode(typeid, value, out)
+        return out
 
-    def _encode(self, typeid):
+    def _encode(self, typeid, value, out):
         go_type = self.types.get(typeid)
         assert go_type != None, 'Invalid typeid %s' % typeid
-        go_type.encode()
+        out += GoInt.encode(typeid)
+        # Top-level singletons are sent with an extra zero byte which
+        # serves as a kind of field delta.
+        if not isinstance(go_type, GoStruct):
+            out.append(0)
+        appender(go_type)(out, value)
@@ -0,0 +1,376 @@
+"""Decoding nested values without recursion.
+
+Structs, slices, arrays and maps normally decode their fields and
+elements by calling the decoders of their types, so every level of
+nesting takes a Python call and a deeply nested value, such as a long
+chain of a recursive struct, can raise RecursionError. With
+Loader(iterative=True), values of these types are decoded by a single
+loop instead, which keeps the values still being decoded on a stack of
+its own: Python's stack stays the same at any depth.
+
+Types are compiled into nodes once per loader. Types whose values can
+nest no deeper than the type itself, such as a struct of ints and
+strings or a slice of those, keep their usual decoders, which are
+fastest for them. Only recursive types go through the stack, where
+their fields are decoded in the loop without a call per level. Values
+that are skipped, such as the fields select leaves out, are skipped by
+a loop of the same kind.
+"""
+
+from functools import partial
+
+from .types import GoUint, GoStruct, GoSlice, GoArray, GoMap
+
+# Node kinds, and the kind of the frame below the outermost value.
+_LEAF, _STRUCT, _SLICE, _ARRAY, _MAP, _ROOT = range(6)
+
+# Passed to a frame that has just been pushed and has no value yet.
+_START = object()
+
+# The key of a map frame that is not waiting for an element.
+_NO_KEY = object()
+
+
+class StackDecoder:
+    """Decodes the compound types of a loader iteratively, see
+    Loader(iterative=True).
+
+    >>> from pygob import Loader, Dumper
+    >>> from typing import NamedTuple
+    >>> class Node(NamedTuple):
+    ...     Value: int
+    ...     Children: list['Node']
+    >>> buf = Dumper().dump(Node(1, [Node(2, []), Node(3, [Node(4, [])])]))
+    >>> Loader(iterative=True).load(buf)
+    Node(Value=1, Children=[Node(Value=2, Children=[]), \
+Node(Value=3, Children=[Node(Value=4, Children=[])])])
+    """
+
+    def __init__(self, loader):
+        self._loader = loader
+        # Nodes by type id, compiled on first use.
+        self._nodes = {}
+        # Nodes for skipping values by type id, see skipper().
+        self._skip_nodes = {}
+
+    def invalidate(self):
+        """Forget the compiled nodes, see Loader.register."""
+        self._nodes = {}
+        self._skip_nodes = {}
+
+    def handles(self, typeid):
+        """Check if values of typeid are decoded by the stack decoder."""
+        return (typeid not in self._loader._bootstrap and
+                isinstance(self._loader.types.get(typeid),
+                           (GoStruct, GoSlice, GoArray, GoMap)))
+
+    def decoder(self, typeid):
+        """Return the decode function for typeid."""
+        node = self._node(typeid)
+        if node[0] == _LEAF:
+            return node[1]
+        return partial(_decode, node)
+
+    def _node(self, typeid):
+        node = self._nodes.get(typeid)
+        if node is not None:
+            return node
+        loader = self._loader
+        if not self._nodes and not self._skip_nodes:
+            loader.compiled(self)
+        if not self.handles(typeid):
+            node = self._nodes[typeid] = [_LEAF, loader.decoder(typeid)]
+            return node
+
+        go_type = loader.types[typeid]
+        # Nodes are registered before their children are compiled, so
+        # that recursive types refer back to them.
+        if isinstance(go_type, GoStruct):
+            if go_type._zero is None:
+                go_type.compile()
+            node = self._nodes[typeid] = [
+                _STRUCT, go_type, None, go_type._zeros, go_type._make,
+                go_type._fresh]
+            node[2] = [self._node(t) for _, t in go_type._fields]
+            _flatten(node, go_type)
+        elif isinstance(go_type, GoMap):
+            node = self._nodes[typeid] = [_MAP, None, None]
+            node[1] = self._node(go_type._key_typeid)
+            node[2] = self._node(go_type._elem_typeid)
+            _flatten(node, go_type)
+        else:
+            array = isinstance(go_type, GoArray)
+            node = self._nodes[typeid] = [
+                _ARRAY if array else _SLICE, None, None,
+                go_type._length if array else None]
+            node[1] = self._node(go_type._elem)
+            _flatten(node, go_type)
+        return node
+
+    def skipper(self, typeid):
+        """Return the skip function for typeid.
+
+        A chain of 5000 links nested in each other, sent after the type
+        definitions of a chain of two, is skipped beyond Python's
+        recursion limit:
+
+        >>> from pygob import Loader, Dumper
+        >>> from typing import NamedTuple
+        >>> class Link(NamedTuple):
+        ...     Value: int
+        ...     Next: list['Link']
+        >>> buf = Dumper().dump(Link(1, [Link(1, [])]))
+        >>> buf[-11:].hex(' ')
+        '0a ff 80 01 02 01 01 01 02 00 00'
+        >>> value = (b'\\xff\\x80' + b'\\x01\\x02\\x01\\x01' * 5000 +
+        ...          b'\\x01\\x02\\x00' + b'\\x00' * 5000)
+        >>> buf = buf[:-11] + GoUint.encode(len(value)) + value
+        >>> Loader(iterative=True).load(buf, select=['Value'])
+        {'Value': 1}
+        """
+        node = self._skip_node(typeid)
+        if node[0] == _LEAF:
+            return node[1]
+        return partial(_skip, node)
+
+    def _skip_node(self, typeid):
+        node = self._skip_nodes.get(typeid)
+        if node is not None:
+            return node
+        loader = self._loader
+        if not self._nodes and not self._skip_nodes:
+            loader.compiled(self)
+        if not self.handles(typeid):
+            node = self._skip_nodes[typeid] = [_LEAF, loader.skipper(typeid)]
+            return node
+
+        go_type = loader.types[typeid]
+        # Arrays are skipped like slices, their length is not checked.
+        if isinstance(go_type, GoStruct):
+            node = self._skip_nodes[typeid] = [_STRUCT, None]
+            node[1] = [self._skip_node(t) for _, t in go_type._fields]
+            children = node[1]
+        elif isinstance(go_type, GoMap):
+            node = self._skip_nodes[typeid] = [_MAP, None, None]
+            node[1] = self._skip_node(go_type._key_typeid)
+            node[2] = self._skip_node(go_type._elem_typeid)
+            children = node[1:]
+        else:
+            node = self._skip_nodes[typeid] = [_SLICE, None]
+            node[1] = self._skip_node(go_type._elem)
+            children = node[1:]
+        if all(child[0] == _LEAF for child in children):
+            node[:] = [_LEAF, go_type.skip]
+        return node
+
+
+def _flatten(node, go_type):
+    """Turn node into a leaf if its children are leaves. Such a value is
+    nested no deeper than its type, and its own decoder is faster.
+    Recursive types refer to their own node, which is not a leaf yet.
+    """
+    if node[0] == _STRUCT:
+        children = node[2]
+    elif node[0] == _MAP:
+        children = node[1:]
+    else:
+        children = node[1:2]
+    if all(child[0] == _LEAF for child in children):
+        node[:] = [_LEAF, go_type.decode]
+
+
+def _decode(root, buf, pos=0):
+    """Decode the value of the compound node root at pos. Returns the
+    value and the position after it.
+
+    The value being decoded is described by kind, node, items, state and
+    key; the ones it is nested in wait on the stack. items holds the
+    values so far, state is the current field of a struct, the number of
+    elements of a slice or array, or the number of entries left of a map,
+    whose key waiting for its element is key.
+    """
+    decode_uint = GoUint.decode
+    stack = []
+    push = stack.append
+    pop = stack.pop
+    kind = _ROOT
+    node = items = state = key = None
+    value = _START
+    child = root
+    while True:
+        if child is not None:
+            # Start on a value of child. Empty slices, arrays and maps
+            # are complete at once and handed to the current value.
+            child_kind = child[0]
+            if child_kind == _STRUCT:
+                push((kind, node, items, state, key))
+                kind = _STRUCT
+                node = child
+                items = list(child[3])
+                state = -1
+                value = _START
+            else:
+                count = buf[pos]
+                if count < 128:
+                    pos += 1
+                else:
+                    count, pos = decode_uint(buf, pos)
+                if child_kind == _ARRAY:
+                    assert count == child[3], \
+                        "expected %d elements, found %d" % (child[3], count)
+                if count:
+                    push((kind, node, items, state, key))
+                    kind = child_kind
+                    node = child
+                    items = {} if child_kind == _MAP else []
+                    state = count
+                    key = _NO_KEY
+                    value = _START
+                elif child_kind == _SLICE:
+                    value = []
+                elif child_kind == _MAP:
+                    value = {}
+                else:
+                    value = ()
+            child = None
+
+        if kind == _STRUCT:
+            if value is not _START:
+                items[state] = value
+            fields = node[2]
+            while True:
+                # Most deltas fit in a byte, read them without a call.
+                delta = buf[pos]
+                if delta < 128:
+                    pos += 1
+                else:
+                    delta, pos = decode_uint(buf, pos)
+                if delta == 0:
+                    break
+                state += delta
+                field = fields[state]
+                if field[0] != _LEAF:
+                    child = field
+                    break
+                items[state], pos = field[1](buf, pos)
+            if child is not None:
+                continue
+            if node[5]:
+                # Mutable zeros of fields Go left out are made anew.
+                zeros = node[3]
+                for index, type_ in node[5]:
+                    if items[index] is zeros[index]:
+                        items[index] = type_.zero
+            value = node[4](items)
+        elif kind == _SLICE or kind == _ARRAY:
+            if value is not _START:
+                items.append(value)
+            if len(items) < state:
+                child = node[1]
+                continue
+            value = items if kind == _SLICE else tuple(items)
+        elif kind == _MAP:
+            if value is not _START:
+                if key is _NO_KEY:
+                    key = value
+                else:
+                    items[key] = value
+                    key = _NO_KEY
+                    state -= 1
+            key_node = node[1]
+            elem_node = node[2]
+            while state:
+                if key is _NO_KEY:
+                    if key_node[0] != _LEAF:
+                        child = key_node
+                        break
+                    key, pos = key_node[1](buf, pos)
+                if elem_node[0] != _LEAF:
+                    child = elem_node
+                    break
+                items[key], pos = elem_node[1](buf, pos)
+                key = _NO_KEY
+                state -= 1
+            if child is not None:
+                continue
+            value = items
+        else:
+            return value, pos
+        kind, node, items, state, key = pop()
+
+
+def _skip(root, buf, pos=0):
+    """Return the position after the value of the compound skip node
+    root at pos.
+
+    Like in _decode, the value being skipped is described by kind, node
+    and state, the current field of a struct, the number of elements of
+    a slice or array left, or the number of keys and elements of a map
+    left, and the ones it is nested in wait on the stack.
+    """
+    decode_uint = GoUint.decode
+    stack = []
+    push = stack.append
+    pop = stack.pop
+    kind = _ROOT
+    node = None
+    state = 0
+    child = root
+    while True:
+        if child is not None:
+            if child[0] == _STRUCT:
+                push((kind, node, state))
+                kind = _STRUCT
+                node = child
+                state = -1
+            else:
+                count = buf[pos]
+                if count < 128:
+                    pos += 1
+                else:
+                    count, pos = decode_uint(buf, pos)
+                if count:
+                    push((kind, node, state))
+                    kind = child[0]
+                    node = child
+                    state = 2 * count if kind == _MAP else count
+            child = None
+
+        if kind == _STRUCT:
+            fields = node[1]
+            while True:
+                delta = buf[pos]
+                if delta < 128:
+                    pos += 1
+                else:
+                    delta, pos = decode_uint(buf, pos)
+                if delta == 0:
+                    break
+                state += delta
+                field = fields[state]
+                if field[0] != _LEAF:
+                    child = field
+                    break
+                pos = field[1](buf, pos)
+            if child is not None:
+                continue
+        elif kind == _SLICE:
+            # Elements of a slice node are not leaves, see _skip_node.
+            if state:
+                state -= 1
+                child = node[1]
+                continue
+        elif kind == _MAP:
+            while state:
+                # Keys come at even counts left, elements at odd ones.
+                child = node[1] if state % 2 == 0 else node[2]
+                state -= 1
+                if child[0] != _LEAF:
+                    break
+                pos = child[1](buf, pos)
+                child = None
+            if child is not None:
+                continue
+        else:
+            return pos
+        kind, node, state = pop()
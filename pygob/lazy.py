@@ -0,0 +1,88 @@
+"""Lazily decoded structs.
+
+With Loader(lazy=True), structs are decoded into LazyStruct proxies
+which only know where each field starts. A field is decoded the first
+time it is accessed; fields that are never accessed, such as large
+byte slices, are skipped over and never copied.
+"""
+
+_MISSING = object()
+
+
+class LazyStruct:
+    """A struct whose fields are decoded on first access.
+
+    It reads like the namedtuple the struct would otherwise decode to:
+    fields are attributes and items, and it iterates, compares and
+    prints the same. It keeps the buffer it was decoded from alive.
+    Dumper encodes it like the record it stands for:
+
+    >>> from pygob import Loader, Dumper
+    >>> from typing import NamedTuple
+    >>> class Point(NamedTuple):
+    ...     X: int
+    ...     Y: int
+    >>> point = Loader(lazy=True).load(Dumper().dump(Point(1, 2)))
+    >>> Loader().load(Dumper().dump(point))
+    Point(X=1, Y=2)
+    """
+    __slots__ = ('_type', '_plan', '_buf', '_offsets', '_values')
+
+    def __init__(self, go_type, plan, buf, offsets):
+        self._type = go_type
+        self._plan = plan
+        self._buf = buf
+        self._offsets = offsets
+        self._values = [_MISSING] * len(offsets)
+
+    @property
+    def _fields(self):
+        return self._type._class._fields
+
+    def __getattr__(self, name):
+        try:
+            index = self._type._index[name]
+        except KeyError:
+            raise AttributeError('%r object has no attribute %r' %
+                                 (self._type._class.__name__, name))
+        return self[index]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return tuple(self)[index]
+        value = self._values[index]
+        if value is _MISSING:
+            offset = self._offsets[index]
+            if offset is None:
+                value = self._type.field_zero(index)
+            else:
+                value, _ = self._plan[index](self._buf, offset)
+            self._values[index] = value
+        return value
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def __iter__(self):
+        for index in range(len(self._offsets)):
+            yield self[index]
+
+    def __eq__(self, other):
+        if isinstance(other, (tuple, LazyStruct)):
+            return tuple(self) == tuple(other)
+        return NotImplemented
+
+    def __hash__(self):
+        return hash(tuple(self))
+
+    def __repr__(self):
+        fields = ', '.join('%s=%r' % (name, value)
+                           for name, value in zip(self._fields, self))
+        return '%s(%s)' % (self._type._class.__name__, fields)
+
+    def _asdict(self):
+        return dict(zip(self._fields, self))
+
+    def _replace(self, **kwargs):
+        """Return a namedtuple of the struct with some fields replaced."""
+        return self._type._class._make(self)._replace(**kwargs)
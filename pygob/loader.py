@@ -1,82 +1,70 @@
+import mmap as _mmap
+
 from .types import (BOOL, INT, UINT, FLOAT, BYTE_SLICE, STRING, COMPLEX,
-                    WIRE_TYPE, ARRAY_TYPE, COMMON_TYPE, SLICE_TYPE,
+                    INTERFACE, WIRE_TYPE, ARRAY_TYPE, COMMON_TYPE, SLICE_TYPE,
                     STRUCT_TYPE, FIELD_TYPE, FIELD_TYPE_SLICE, MAP_TYPE,
                     GOB_ENCODER_TYPE, BINARY_MARSHALER_TYPE, TEXT_MARSHALER_TYPE)
 from .types import (GoBool, GoUint, GoInt, GoFloat, GoByteSlice, GoString,
-                    GoComplex, GoStruct, GoWireType, GoSlice)
+                    GoComplex, GoStruct, GoWireType, GoSlice, GoInterface,
+                    GoText, run_decoder, _Continued, _Undefined)
 from .encoder import Encoder
+from .projection import Projection
+from .records import RECORDS
 
 
 class Loader:
-    def __init__(self):
-        # Compound types that depend on the basic types above.
-        common_type = GoStruct(COMMON_TYPE, 'CommonType', self, [
-            ('Name', STRING),
-            ('Id', INT),
-        ])
-        array_type = GoStruct(ARRAY_TYPE, 'ArrayType', self, [
-            ('CommonType', COMMON_TYPE),
-            ('Elem', INT),
-            ('Len', INT),
-        ])
-        slice_type = GoStruct(SLICE_TYPE, 'SliceType', self, [
-            ('CommonType', COMMON_TYPE),
-            ('Elem', INT),
-        ])
-        struct_type = GoStruct(STRUCT_TYPE, 'StructType', self, [
-            ('CommonType', COMMON_TYPE),
-            ('Field', FIELD_TYPE_SLICE),
-        ])
-        field_type = GoStruct(FIELD_TYPE, 'FieldType', self, [
-            ('Name', STRING),
-            ('Id', INT),
-        ])
-        field_type_slice = GoSlice(FIELD_TYPE_SLICE, self, FIELD_TYPE)
-        map_type = GoStruct(MAP_TYPE, 'MapType', self, [
-            ('CommonType', COMMON_TYPE),
-            ('Key', INT),
-            ('Elem', INT),
-        ])
-        wire_type = GoWireType(WIRE_TYPE, 'WireType', self, [
-            ('ArrayT', ARRAY_TYPE),
-            ('SliceT', SLICE_TYPE),
-            ('StructT', STRUCT_TYPE),
-            ('MapT', MAP_TYPE),
-            ('GobEncoderT', GOB_ENCODER_TYPE),
-            ('BinaryMarshalerT', BINARY_MARSHALER_TYPE),
-            ('TextMarshalerT', TEXT_MARSHALER_TYPE),
-        ])
-        gob_encoder_type = GoStruct(GOB_ENCODER_TYPE, 'GobEncoderType', self, [
-            ('CommonType', COMMON_TYPE),
-        ])
-        binary_marshaler_type = GoStruct(BINARY_MARSHALER_TYPE, 'BinaryMarshalerType', self, [
-            ('CommonType', COMMON_TYPE),
-        ])
-        text_marshaler_type = GoStruct(TEXT_MARSHALER_TYPE, 'TextMarshalerType', self, [
-            ('CommonType', COMMON_TYPE),
-        ])
-
-        # We can now register basic and compound types.
-        self.types = {
-            INT: GoInt,
-            UINT: GoUint,
-            BOOL: GoBool,
-            FLOAT: GoFloat,
-            BYTE_SLICE: GoByteSlice,
-            STRING: GoString,
-            COMPLEX: GoComplex,
-            WIRE_TYPE: wire_type,
-            ARRAY_TYPE: array_type,
-            COMMON_TYPE: common_type,
-            SLICE_TYPE: slice_type,
-            STRUCT_TYPE: struct_type,
-            FIELD_TYPE: field_type,
-            FIELD_TYPE_SLICE: field_type_slice,
-            MAP_TYPE: map_type,
-            GOB_ENCODER_TYPE: gob_encoder_type,
-            BINARY_MARSHALER_TYPE: binary_marshaler_type,
-            TEXT_MARSHALER_TYPE: text_marshaler_type,
-        }
+    def __init__(self, copy=True, numeric=None, lazy=False, cache=None,
+                 record='namedtuple', interfaces='decode', strings='bytes',
+                 intern=False, compiled=None, iterative=False):
+        """Create a loader.
+
+        With copy=False, byte slices and strings are decoded as
+        read-only memoryviews into the input buffer instead of being
+        copied out of it.
+
+        With numeric='numpy', slices and arrays of bools, ints, uints
+        and floats are decoded into bool, int64, uint64 and float64
+        NumPy arrays instead of lists and tuples.
+
+        With lazy=True, structs defined by the stream are decoded into
+        LazyStruct proxies, which decode each field on first access and
+        skip over the others without copying them.
+
+        With iterative=True, values of recursive types defined by the
+        stream are decoded, or skipped when select leaves them out, by a
+        loop with a stack of its own instead of by recursive calls, so
+        they can be nested to any depth; see pygob.iterative.
+
+        record chooses what structs defined by the stream are decoded
+        into: 'namedtuple' (the default), 'slots' for instances of
+        generated classes with __slots__, which take the least memory,
+        'tuple' for plain tuples, whose field indexes field_index()
+        returns, or 'dict' for dicts keyed by field name.
+
+        With strings='str', strings are decoded as UTF-8 into str,
+        falling back to bytes for invalid UTF-8. With intern=True,
+        repeated short strings are decoded once and then shared, up to a
+        bounded number of distinct strings per loader; see GoText.
+
+        interfaces says which interface values are decoded: with
+        'decode' all of them, with 'registered' only those whose
+        concrete type was registered with register_name(). The others
+        are skipped and become OpaqueInterface(Name, Typeid, Data).
+
+        compiled is a module generated by python -m pygob.compile, or
+        its name. Types defined exactly as in the module are taken from
+        it and their structs decoded by its generated functions.
+
+        With a pygob.TypeCache as cache, type definitions are looked up
+        in the cache and the types decoded for an identical schema by
+        an earlier loader are reused instead of being decoded again.
+        """
+        # The types describing the stream itself are shared by every
+        # loader, see _BootstrapLoader.
+        self.types = dict(_BOOTSTRAP.types)
+        # Interfaces are decoded by the loader that meets them.
+        self.types[INTERFACE] = GoInterface(self)
+        self._bootstrap = _BOOTSTRAP._bootstrap | {INTERFACE}
 
         self.python_types = {
             bool: GoBool,
@@ -89,69 +77,612 @@ class Loader:
 
         self.prelude = bytearray()
 
-    def load(self, buf):
-        value, buf = self._load(buf)
+        # Types whose decode plan has been compiled, see compiled().
+        self._compiled = []
+
+        # Decoders used instead of types[typeid].decode. Custom types
+        # are registered with us, not with the shared wire type.
+        self._decoders = {WIRE_TYPE: self._decode_wire_type}
+        if not copy:
+            self._decoders[BYTE_SLICE] = GoByteSlice.decode_view
+            self._decoders[STRING] = GoString.decode_view
+        if strings not in ('bytes', 'str'):
+            raise ValueError('unknown strings mode: %r' % strings)
+        if strings == 'str' or intern:
+            # Views would have to be copied to be decoded or shared.
+            self._decoders.pop(STRING, None)
+            self.types[STRING] = GoText(intern, text=strings == 'str')
+        self._copy = copy
+        self._lazy = lazy
+        # Decodes compound values without recursion, see decoder().
+        self._engine = None
+        if iterative:
+            if lazy:
+                raise ValueError('lazy=True and iterative=True cannot be '
+                                 'used together')
+            from .iterative import StackDecoder
+            self._engine = StackDecoder(self)
+        if record not in RECORDS:
+            raise ValueError('unknown record kind: %r' % record)
+        self._record = record
+        if interfaces not in ('decode', 'registered'):
+            raise ValueError('unknown interfaces mode: %r' % interfaces)
+        self._interfaces = interfaces
+        # Functions converting interface values by concrete type name,
+        # or None to keep them as they are.
+        self._concrete_types = {}
+
+        # Decoders for runs of slice and array elements used instead of
+        # types[typeid].decode_run.
+        self._run_decoders = {}
+        if numeric == 'numpy':
+            from . import ndarray
+            self._run_decoders.update(ndarray.RUN_DECODERS)
+        elif numeric is not None:
+            raise ValueError('unknown numeric mode: %r' % numeric)
+
+        # Types generated ahead of time, see pygob.compile.
+        self._schema = None
+        if compiled is not None:
+            from .compile import CompiledSchema
+            self._schema = CompiledSchema(compiled)
+
+        # Options a template loader for the type cache is created with.
+        self._options = dict(copy=copy, numeric=numeric, lazy=lazy,
+                             record=record, interfaces=interfaces,
+                             strings=strings, intern=intern,
+                             compiled=compiled, iterative=iterative)
+        self._cache = cache
+        # Definition segments seen so far, resolved through the cache
+        # when the next value arrives.
+        self._definitions = []
+        self._unresolved = False
+        # Templates of a TypeCache share their types with every loader
+        # adopting them, see _define_inline.
+        self._shared = False
+        # Definitions registered, by type id, as sent.
+        self._defined = {}
+
+        # DecodeStats filled in while instrumented, see instrument().
+        self._stats = None
+        self._last_stats = None
+
+    def load(self, buf, select=None):
+        """Decode the first value in buf.
+
+        With select, a list of dotted paths such as 'Depots.*.Id', only
+        those paths are decoded and a dict keyed by path is returned;
+        see pygob.projection.
+        """
+        projection = None if select is None else Projection(select)
+        value, pos = self._load(memoryview(buf).toreadonly(), 0, projection)
         return value
 
-    def load_all(self, buf):
-        while buf:
-            value, buf = self._load(buf)
+    def load_all(self, buf, select=None):
+        projection = None if select is None else Projection(select)
+        # Read-only views are hashable, so views of strings can be used
+        # as map keys.
+        buf = memoryview(buf).toreadonly()
+        pos = 0
+        while pos < len(buf):
+            value, pos = self._load(buf, pos, projection)
             yield value
-        assert buf == b'', 'trailing data in buffer: %s' % list(buf)
 
-    def _read_segment(self, buf):
-        length, buf = GoUint.decode(buf)
-        return buf[:length], buf[length:]
+    def load_file(self, path, mmap=True):
+        """Decode all gobs in the file at path and return them in a list.
+
+        With mmap=True the file is memory-mapped and decoded in place
+        instead of being read into memory. Combined with copy=False,
+        byte slices and strings stay views into the mapping, which
+        remains open for as long as any of them is alive; so do the
+        values of a lazy loader.
+        """
+        with open(path, 'rb') as f:
+            if not mmap:
+                return list(self.load_all(f.read()))
+            try:
+                mapping = _mmap.mmap(f.fileno(), 0, access=_mmap.ACCESS_READ)
+            except ValueError:
+                return []  # empty files cannot be mapped
+        values = list(self.load_all(mapping))
+        if self._copy and not self._lazy:
+            # Lazy values keep views into the mapping to decode from.
+            mapping.close()
+        return values
 
-    def _load(self, buf):
+    def iter_load(self, fileobj):
+        """Decode all gobs in a binary file object, yielding each value as
+        soon as it has been read. Only one segment is held in memory at
+        a time, so this works for pipes and sockets (wrapped with
+        socket.makefile('rb')) as well as for large files.
+        """
         while True:
-            segment, buf = self._read_segment(buf)
-            typeid, segment = GoInt.decode(segment)
-            if typeid > 0:
-                break  # Found a value.
+            head = fileobj.read(1)
+            if not head:
+                return
+            if head[0] >= 128:
+                head += _read_exactly(fileobj, 256 - head[0])
+            length, _ = GoUint.decode(head)
+            segment = _read_exactly(fileobj, length)
+            segment = memoryview(segment)
+            try:
+                found, value = self._load_segment(segment)
+            except _Continued:
+                found, value = self._load_continued(
+                    segment, lambda: _read_raw(fileobj))
+            if found:
+                yield value
 
-            # Decode wire type and register type for later.
-            custom_type, segment = self.decode_value(WIRE_TYPE, segment)
-            self.types[-typeid] = custom_type
-            assert segment == b'', ('trailing data in segment: %s' %
-                                    list(segment))
+    def _read_segment(self, buf, pos):
+        # The segment is a view into buf, not a copy.
+        length, pos = GoUint.decode(buf, pos)
+        end = pos + length
+        assert end <= len(buf), 'truncated segment: %d bytes missing' % (
+            end - len(buf))
+        return buf[pos:end], end
+
+    def _load(self, buf, pos, projection=None):
+        while True:
+            segment, pos = self._read_segment(buf, pos)
+            try:
+                found, value = self._load_segment(segment, projection)
+            except _Continued:
+                def more():
+                    nonlocal pos
+                    assert pos < len(buf), (
+                        'value goes on past the end of the stream')
+                    start = pos
+                    _, pos = self._read_segment(buf, pos)
+                    return buf[start:pos]
+                found, value = self._load_continued(segment, more, projection)
+            if found:
+                return value, pos
+
+    def _load_continued(self, segment, more, projection=None):
+        """Decode the value in segment, which goes on in the segments more
+        returns one at a time, as sent, length and all; see GoInterface.
+        """
+        while True:
+            segment = memoryview(bytes(segment) + bytes(more())).toreadonly()
+            try:
+                return self._load_segment(segment, projection)
+            except _Continued:
+                pass
+
+    def _load_segment(self, segment, projection=None):
+        """Decode a single segment. Returns (True, value) for a value and
+        (False, None) for a type definition. Values are projected if a
+        projection is given.
+
+        A value that goes on in the next segment raises _Continued, see
+        GoInterface.
+        """
+        typeid, start = GoInt.decode(segment)
+        if typeid < 0:
+            self._define(segment)
+            return False, None
+
+        if self._unresolved:
+            self._resolve_definitions()
 
         # Top-level singletons are sent with an extra zero byte which
         # serves as a kind of field delta.
         go_type = self.types.get(typeid)
         if go_type is not None and not isinstance(go_type, GoStruct):
-            assert segment[0] == 0, 'illegal delta for singleton: %s' % buf[0]
-            segment = segment[1:]
-        value, segment = self.decode_value(typeid, segment)
-        assert segment == b'', 'trailing data in segment: %s' % list(segment)
-        return value, buf
+            assert segment[start] == 0, (
+                'illegal delta for singleton: %s' % segment[start])
+            start += 1
+        while True:
+            try:
+                if projection is not None:
+                    value, offset = projection.project(self, typeid, segment,
+                                                       start)
+                else:
+                    value, offset = self.decode_value(typeid, segment, start)
+                break
+            except _Undefined as undefined:
+                # Decoded again with the types of a template defining it.
+                self._define(memoryview(undefined.definition))
+                self._resolve_definitions()
+        assert offset == len(segment), (
+            'trailing data in segment: %s' % list(segment[offset:]))
+        return True, value
+
+    def _define(self, segment):
+        """Register the type defined by segment, its negated type id
+        followed by its wire type.
+        """
+        typeid, offset = GoInt.decode(segment)
+        if self._stats is not None:
+            self._stats.definitions += 1
+        if self._cache is not None:
+            segment = bytes(segment)
+            self._definitions.append(segment)
+            self._unresolved = True
+            return
+        custom_type = None
+        if self._schema is not None:
+            custom_type = self._schema.build(self, -typeid, segment)
+        if custom_type is None:
+            # Decode wire type and register type for later.
+            custom_type, offset = self.decode_value(WIRE_TYPE, segment,
+                                                    offset)
+            assert offset == len(segment), (
+                'trailing data in segment: %s' % list(segment[offset:]))
+        self.register(-typeid, custom_type)
+        self._defined[-typeid] = bytes(segment)
+
+    def _define_inline(self, definition):
+        """Register the type defined by definition, met in an interface
+        value, unless it is registered already. Loaders sharing their
+        types, and those taking them from a TypeCache, leave it to the
+        loader decoding the value, which adds it to its definitions and
+        decodes the value again.
+        """
+        typeid, _ = GoInt.decode(definition)
+        if self._defined.get(-typeid) == definition:
+            return
+        if self._shared or self._cache is not None:
+            raise _Undefined(definition)
+        self._define(memoryview(definition))
+
+    def _resolve_definitions(self):
+        """Adopt the types of the template loader cached for the
+        definitions seen so far, decoding them into a new one first if
+        the schema has not been seen before.
+        """
+        # Struct plans decode interface fields with the template's
+        # GoInterface, so templates are kept apart by registered names.
+        key = (tuple(sorted(self._options.items())),
+               tuple(self._concrete_types.items()),
+               tuple(self._definitions))
+        template = self._cache.template(key, self._build_template)
+        for typeid, go_type in template.types.items():
+            if typeid not in template._bootstrap:
+                self.types[typeid] = go_type
+        self._unresolved = False
+
+    def _build_template(self):
+        template = Loader(**self._options)
+        template._shared = True
+        for name, convert in self._concrete_types.items():
+            template.register_name(name, convert)
+        for segment in self._definitions:
+            template._load_segment(memoryview(segment))
+        return template
+
+    def register_name(self, name, convert=None):
+        """Register the concrete type name, as registered with Go's
+        gob.Register, for interface values. Their values are passed
+        through convert, if given, once decoded:
+
+        >>> loader = Loader(interfaces='registered')
+        >>> loader.register_name('int', str)
+        >>> loader.decode_value(INTERFACE, b'\\x03int\\x04\\x02\\x00\\x0e')
+        ('7', 8)
+
+        Interface fields of structs are converted the same way, also
+        with types shared through a TypeCache, which keeps the types of
+        loaders with different names apart:
+
+        >>> from pygob import TypeCache
+        >>> buf = bytes.fromhex(
+        ...     '15 ff 81 03 01 01 01 54 01 ff 82 00 01 01 01 01 56 01 10 00'
+        ...     '00 00 0c ff 82 01 03 69 6e 74 04 02 00 0e 00')
+        >>> cache = TypeCache()
+        >>> Loader(cache=cache, interfaces='registered').load(buf)
+        T(V=OpaqueInterface(Name='int', Typeid=2, Data=b'\\x00\\x0e'))
+        >>> loader = Loader(cache=cache, interfaces='registered')
+        >>> loader.register_name('int', str)
+        >>> loader.load(buf)
+        T(V='7')
+        """
+        self._concrete_types[name] = convert
+        self.types[INTERFACE].invalidate()
+        if self._definitions:
+            # Take the types from a template with the same names.
+            self._unresolved = True
+
+    def field_index(self, name):
+        """Return a dict mapping each field of the struct type called name
+        to its index in decoded values, for use with record='tuple'.
+        """
+        for go_type in self.types.values():
+            if isinstance(go_type, GoStruct) and go_type._name == name:
+                return {field: index
+                        for index, (field, _) in enumerate(go_type._fields)}
+        raise KeyError('no struct type %r' % name)
 
-    def decode_value(self, typeid, buf):
+    def _decode_wire_type(self, buf, pos=0):
+        return self.types[WIRE_TYPE].decode(buf, pos, self)
+
+    def register(self, typeid, go_type):
+        """Register go_type under typeid.
+
+        Compiled decode plans have their field and element decoders
+        resolved already, so redefining a type id invalidates them.
+        They are rebuilt on first use.
+
+        Lazy values decode their fields later with the types they were
+        decoded with, so a lazy loader leaves those to them and carries
+        on with copies instead:
+
+        >>> from typing import NamedTuple
+        >>> from pygob import Dumper
+        >>> class A(NamedTuple):
+        ...     X: int
+        >>> class W(NamedTuple):
+        ...     Items: list[A]
+        >>> class B(NamedTuple):
+        ...     Name: str
+        ...     Y: int
+        >>> class W2(NamedTuple):
+        ...     Items: list[B]
+        >>> buf = Dumper().dump(W([A(1)])) + Dumper().dump(W2([B('q', 2)]))
+        >>> list(Loader(lazy=True).load_all(buf))
+        [W(Items=[A(X=1)]), W2(Items=[B(Name=b'q', Y=2)])]
+        """
+        previous = self.types.get(typeid)
+        if previous is not None and previous is not go_type:
+            if self._lazy:
+                self._detach_types()
+            else:
+                self._invalidate_compiled()
+        self.types[typeid] = go_type
+
+    def _detach_types(self):
+        """Hand the types defined so far over to a frozen copy of this
+        loader, and go on with fresh copies of them.
+        """
+        import copy
+        frozen = copy.copy(self)
+        frozen.types = dict(self.types)
+        frozen._defined = dict(self._defined)
+        frozen._compiled = []
+        for typeid, go_type in frozen.types.items():
+            # Interface values are decoded with the types of the loader
+            # that meets them.
+            if typeid in self._bootstrap and typeid != INTERFACE:
+                continue
+            go_type._loader = frozen
+            fresh = copy.copy(go_type)
+            fresh._loader = self
+            fresh.invalidate()
+            self.types[typeid] = fresh
+        self._compiled = []
+
+    def _invalidate_compiled(self):
+        for compiled in self._compiled:
+            compiled.invalidate()
+        self._compiled = []
+
+    def compiled(self, go_type):
+        """Record that go_type has compiled a plan against our types."""
+        self._compiled.append(go_type)
+
+    def decoder(self, typeid):
+        """Return the decode function for typeid."""
+        decode = self._decoders.get(typeid)
+        if decode is None:
+            go_type = self.types.get(typeid)
+            if go_type is None:
+                raise NotImplementedError("cannot decode %s" % typeid)
+            if (self._lazy and isinstance(go_type, GoStruct) and
+                    typeid not in self._bootstrap):
+                decode = go_type.decode_lazy
+            elif self._engine is not None and self._engine.handles(typeid):
+                decode = self._engine.decoder(typeid)
+            else:
+                decode = go_type.decode
+        if self._stats is not None:
+            from .stats import type_name
+            decode = self._stats.wrap(typeid, self.types.get(typeid),
+                                      type_name(self.types, typeid), decode)
+        return decode
+
+    def instrument(self):
+        """Return a context manager counting, per type id, the values
+        decoded, the bytes they took up and the time spent on them, as
+        well as the type definitions registered:
+
+        >>> loader = Loader()
+        >>> with loader.instrument():
+        ...     loader.load(bytes([3, 4, 0, 6]))
+        3
+        >>> stats = loader.stats()
+        >>> stats['types'][2]['values'], stats['types'][2]['bytes']
+        (1, 1)
+
+        Decoders are wrapped for counting on entry and unwrapped on
+        exit, so a loader that is not instrumented pays nothing. Types
+        adopted from a TypeCache are only counted as top-level values,
+        and with iterative=True recursive values nested in each other
+        only as the outermost one; see pygob.stats.
+        """
+        from .stats import DecodeStats, Instrumented
+        return Instrumented(self, DecodeStats())
+
+    def stats(self):
+        """Return the counters of the current or last instrument() block
+        as a dict, or None if the loader was never instrumented. See
+        pygob.stats.DecodeStats.snapshot.
+        """
+        if self._last_stats is None:
+            return None
+        return self._last_stats.snapshot()
+
+    def _set_stats(self, stats):
+        # Compiled plans hold the decoders they resolved, so they are
+        # rebuilt to pick up (or drop) the counting wrappers.
+        self._stats = stats
+        if stats is not None:
+            self._last_stats = stats
+        self._invalidate_compiled()
+
+    def skipper(self, typeid):
+        """Return the function skipping over a value of typeid, called as
+        skip(buf, pos) and returning the position after the value.
+        """
         go_type = self.types.get(typeid)
         if go_type is None:
-            raise NotImplementedError("cannot decode %s" % typeid)
-        return go_type.decode(buf)
+            raise NotImplementedError("cannot skip %s" % typeid)
+        if self._engine is not None and self._engine.handles(typeid):
+            return self._engine.skipper(typeid)
+        return go_type.skip
 
-    def get_encoder(self, buf):
-        while True:
-            segment, buf = self._read_segment(buf)
-            typeid, segment = GoInt.decode(segment)
-            if typeid > 0:
-                break  # Found a value.
+    def run_decoder(self, typeid):
+        """Return a function decoding a run of values of typeid, called as
+        decode_run(buf, pos, count) and returning (values, pos).
+        """
+        decode_run = self._run_decoders.get(typeid)
+        if decode_run is not None:
+            return decode_run
+        go_type = self.types.get(typeid)
+        if typeid not in self._decoders and hasattr(go_type, 'decode_run'):
+            return go_type.decode_run
+        return run_decoder(self.decoder(typeid))
 
-            # Decode wire type and register type for later.
-            custom_type, segment = self.decode_value(WIRE_TYPE, segment)
-            self.types[-typeid] = custom_type
-            assert segment == b'', ('trailing data in segment: %s' %
-                                    list(segment))
+    def decode_value(self, typeid, buf, pos=0):
+        return self.decoder(typeid)(buf, pos)
 
-        # Top-level singletons are sent with an extra zero byte which
-        # serves as a kind of field delta.
-        go_type = self.types.get(typeid)
-        if go_type is not None and not isinstance(go_type, GoStruct):
-            assert segment[0] == 0, 'illegal delta for singleton: %s' % buf[0]
-            segment = segment[1:]
-        value, segment = self.decode_value(typeid, segment)
-        assert segment == b'', 'trailing data in segment: %s' % list(segment)
-        return value, buf
+    def get_encoder(self, buf):
+        return self._load(memoryview(buf), 0)
         return Encoder(self.types)
+
+
+def scan_segments(buf):
+    """Yield (start, end, typeid) for every segment of the stream in buf
+    without decoding any of them; typeid is negative for definitions.
+    """
+    pos = 0
+    while pos < len(buf):
+        start = pos
+        length, pos = GoUint.decode(buf, pos)
+        typeid, _ = GoInt.decode(buf, pos)
+        pos += length
+        assert pos <= len(buf), 'truncated segment: %d bytes missing' % (
+            pos - len(buf))
+        yield start, pos, typeid
+
+
+def _read_raw(fileobj):
+    """Read the next segment from fileobj as sent, length and all."""
+    head = fileobj.read(1)
+    if not head:
+        raise EOFError('value goes on past the end of the stream')
+    if head[0] >= 128:
+        head += _read_exactly(fileobj, 256 - head[0])
+    length, _ = GoUint.decode(head)
+    return head + _read_exactly(fileobj, length)
+
+
+def _read_exactly(fileobj, size):
+    """Read exactly size bytes from fileobj, retrying short reads."""
+    data = fileobj.read(size)
+    while len(data) < size:
+        more = fileobj.read(size - len(data))
+        if not more:
+            raise EOFError('truncated segment: %d bytes missing' %
+                           (size - len(data)))
+        data += more
+    return data
+
+
+def _bootstrap_types(loader):
+    """Create the types the protocol is bootstrapped with, compiling
+    their plans against loader.
+    """
+    # Compound types that depend on the basic types.
+    common_type = GoStruct(COMMON_TYPE, 'CommonType', loader, [
+        ('Name', STRING),
+        ('Id', INT),
+    ])
+    array_type = GoStruct(ARRAY_TYPE, 'ArrayType', loader, [
+        ('CommonType', COMMON_TYPE),
+        ('Elem', INT),
+        ('Len', INT),
+    ])
+    slice_type = GoStruct(SLICE_TYPE, 'SliceType', loader, [
+        ('CommonType', COMMON_TYPE),
+        ('Elem', INT),
+    ])
+    struct_type = GoStruct(STRUCT_TYPE, 'StructType', loader, [
+        ('CommonType', COMMON_TYPE),
+        ('Field', FIELD_TYPE_SLICE),
+    ])
+    field_type = GoStruct(FIELD_TYPE, 'FieldType', loader, [
+        ('Name', STRING),
+        ('Id', INT),
+    ])
+    field_type_slice = GoSlice(FIELD_TYPE_SLICE, loader, FIELD_TYPE)
+    map_type = GoStruct(MAP_TYPE, 'MapType', loader, [
+        ('CommonType', COMMON_TYPE),
+        ('Key', INT),
+        ('Elem', INT),
+    ])
+    wire_type = GoWireType(WIRE_TYPE, 'WireType', loader, [
+        ('ArrayT', ARRAY_TYPE),
+        ('SliceT', SLICE_TYPE),
+        ('StructT', STRUCT_TYPE),
+        ('MapT', MAP_TYPE),
+        ('GobEncoderT', GOB_ENCODER_TYPE),
+        ('BinaryMarshalerT', BINARY_MARSHALER_TYPE),
+        ('TextMarshalerT', TEXT_MARSHALER_TYPE),
+    ])
+    gob_encoder_type = GoStruct(GOB_ENCODER_TYPE, 'GobEncoderType', loader, [
+        ('CommonType', COMMON_TYPE),
+    ])
+    binary_marshaler_type = GoStruct(BINARY_MARSHALER_TYPE, 'BinaryMarshalerType', loader, [
+        ('CommonType', COMMON_TYPE),
+    ])
+    text_marshaler_type = GoStruct(TEXT_MARSHALER_TYPE, 'TextMarshalerType', loader, [
+        ('CommonType', COMMON_TYPE),
+    ])
+
+    # We can now register basic and compound types.
+    return {
+        INT: GoInt,
+        UINT: GoUint,
+        BOOL: GoBool,
+        FLOAT: GoFloat,
+        BYTE_SLICE: GoByteSlice,
+        STRING: GoString,
+        COMPLEX: GoComplex,
+        WIRE_TYPE: wire_type,
+        ARRAY_TYPE: array_type,
+        COMMON_TYPE: common_type,
+        SLICE_TYPE: slice_type,
+        STRUCT_TYPE: struct_type,
+        FIELD_TYPE: field_type,
+        FIELD_TYPE_SLICE: field_type_slice,
+        MAP_TYPE: map_type,
+        GOB_ENCODER_TYPE: gob_encoder_type,
+        BINARY_MARSHALER_TYPE: binary_marshaler_type,
+        TEXT_MARSHALER_TYPE: text_marshaler_type,
+    }
+
+
+class _BootstrapLoader(Loader):
+    """The loader owning the bootstrap types.
+
+    They are created once at import and shared by every Loader. Their
+    plans are compiled against this loader and its default options,
+    whatever the options of the loader decoding a stream, so names in
+    type definitions are always copied. Types defined by a stream are
+    registered with the loader decoding it, see Loader.decoder().
+    """
+
+    def __init__(self):
+        self.types = {}
+        self.types = _bootstrap_types(self)
+        # Types describing the stream itself are never decoded lazily.
+        self._bootstrap = frozenset(self.types)
+        self._compiled = []
+        self._decoders = {}
+        self._run_decoders = {}
+        self._lazy = False
+        self._engine = None
+        self._stats = None
+
+
+_BOOTSTRAP = _BootstrapLoader()
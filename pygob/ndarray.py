@@ -0,0 +1,142 @@
+"""NumPy support for numeric slices and arrays.
+
+Imported on demand by Loader(numeric='numpy') and by Dumper when it is
+given an ndarray, so NumPy stays an optional dependency.
+"""
+
+import numpy
+
+from .types import BOOL, INT, UINT, FLOAT, GoUint
+
+# Values are decoded in blocks, so that no more than this many of them
+# are boxed as Python integers at any time.
+BLOCK = 4096
+
+DTYPES = {
+    INT: numpy.int64,
+    UINT: numpy.uint64,
+    FLOAT: numpy.float64,
+}
+
+
+def decode_uint_run(buf, pos, count):
+    """Decode count unsigned integers from buf at pos into a uint64 array.
+
+    >>> decode_uint_run(bytes([1, 2, 254, 1, 0]), 0, 3)
+    (array([  1,   2, 256], dtype=uint64), 5)
+    """
+    result = numpy.empty(count, numpy.uint64)
+    for start in range(0, count, BLOCK):
+        stop = min(start + BLOCK, count)
+        result[start:stop], pos = GoUint.decode_run(buf, pos, stop - start)
+    return result, pos
+
+
+def decode_int_run(buf, pos, count):
+    """Decode count signed integers from buf at pos into an int64 array.
+
+    >>> decode_int_run(bytes([5, 6, 254, 1, 0]), 0, 3)
+    (array([ -3,   3, 128]), 5)
+    """
+    uints, pos = decode_uint_run(buf, pos, count)
+    # Undo the zigzag encoding: the low bit holds the sign.
+    signs = -(uints & numpy.uint64(1))
+    return ((uints >> numpy.uint64(1)) ^ signs).view(numpy.int64), pos
+
+
+def decode_float_run(buf, pos, count):
+    """Decode count floats from buf at pos into a float64 array.
+
+    >>> decode_float_run(bytes([0, 254, 244, 63]), 0, 2)
+    (array([0.  , 1.25]), 4)
+    """
+    uints, pos = decode_uint_run(buf, pos, count)
+    # Floats are sent as byte-reversed 64-bit words.
+    return uints.astype('>u8').view('<f8').astype(numpy.float64), pos
+
+
+def decode_bool_run(buf, pos, count):
+    """Decode count bools from buf at pos into a bool array.
+
+    >>> decode_bool_run(bytes([1, 0, 1]), 0, 3)
+    (array([ True, False,  True]), 3)
+    """
+    uints, pos = decode_uint_run(buf, pos, count)
+    return uints.astype(numpy.bool_), pos
+
+
+# The dtypes arrays are cast to when encoded as elements of a type.
+ELEMENT_DTYPES = {BOOL: numpy.bool_, **DTYPES}
+
+RUN_DECODERS = {
+    BOOL: decode_bool_run,
+    INT: decode_int_run,
+    UINT: decode_uint_run,
+    FLOAT: decode_float_run,
+}
+
+
+def element_typeid(dtype):
+    """Return the typeid of the elements of an array of dtype."""
+    kind = dtype.kind
+    if kind == 'f':
+        return FLOAT
+    if kind == 'b':
+        return BOOL
+    if kind == 'i':
+        return INT
+    if kind == 'u':
+        return UINT
+    raise NotImplementedError("cannot encode array of %s" % dtype)
+
+
+def encode_array(array, typeid=None):
+    """Encode the elements of a one-dimensional numeric array. Returns
+    the element typeid and the encoded elements:
+
+    >>> encode_array(numpy.array([-3, 3, 128]))
+    (2, b'\\x05\\x06\\xfe\\x01\\x00')
+    >>> encode_array(numpy.array([0.0, 1.25]))
+    (4, b'\\x00\\xfe\\xf4?')
+    >>> encode_array(numpy.array([True, False]))
+    (1, b'\\x01\\x00')
+
+    Bool arrays are sent as []bool and come back as bool arrays:
+
+    >>> from pygob import Dumper, Loader
+    >>> buf = Dumper().dump(numpy.array([True, False, True]))
+    >>> Loader(numeric='numpy').load(buf)
+    array([ True, False,  True])
+
+    Given the typeid of the elements, such as the element type of a slice
+    field, the array is cast to it. Casts that NumPy would not make for
+    an operation, such as floats to ints, are refused:
+
+    >>> encode_array(numpy.array([0, 1]), FLOAT)
+    (4, b'\\x00\\xfe\\xf0?')
+    >>> encode_array(numpy.array([0.5]), INT)
+    Traceback (most recent call last):
+    ...
+    NotImplementedError: cannot encode array of float64 as elements of type 2
+    """
+    if array.ndim != 1:
+        raise NotImplementedError("cannot encode %d-dimensional array" %
+                                  array.ndim)
+    if typeid is None:
+        typeid = element_typeid(array.dtype)
+    else:
+        dtype = ELEMENT_DTYPES.get(typeid)
+        if dtype is None or not numpy.can_cast(array.dtype, dtype,
+                                               'same_kind'):
+            raise NotImplementedError(
+                "cannot encode array of %s as elements of type %s" %
+                (array.dtype, typeid))
+    if typeid == FLOAT:
+        uints = array.astype('<f8').view('>u8')
+    elif typeid == INT:
+        ints = array.astype(numpy.int64)
+        # Zigzag encoding moves the sign into the low bit.
+        uints = ((ints << 1) ^ (ints >> 63)).view(numpy.uint64)
+    else:
+        uints = array.astype(numpy.uint64)
+    return typeid, b''.join(map(GoUint.encode, uints.tolist()))
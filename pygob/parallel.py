@@ -0,0 +1,116 @@
+"""Decoding multi-message streams on several cores.
+
+Every message is a length-prefixed segment, so one cheap pass over the
+lengths finds where each message starts and whether it defines a type
+or holds a value. The stream is then cut into chunks of messages which
+worker processes decode from shared memory. A worker first decodes the
+type definitions that came before its chunk, so it knows every type
+its values use, and returns the values of the chunk. Values come back
+in stream order.
+"""
+
+from .loader import Loader, scan_segments
+
+
+def load_all_parallel(buf, workers=None, chunks_per_worker=4, **options):
+    """Decode all gobs in buf with a pool of worker processes and return
+    them in a list, like list(Loader(**options).load_all(buf)).
+
+    >>> from pygob import Dumper
+    >>> dumper = Dumper()
+    >>> buf = b''.join(dumper.dump((i, -i)) for i in range(100))
+    >>> values = load_all_parallel(buf, workers=2)
+    >>> len(values), values[42]
+    (100, (42, -42))
+
+    Values are pickled on their way back, so options that return views
+    into the buffer or lazy structs are not available. Streams too short
+    to be worth splitting are decoded in this process.
+    """
+    if options.get('copy') is False or options.get('lazy'):
+        raise ValueError('copy=False and lazy=True cannot be used '
+                         'with parallel decoding')
+    import os
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    buf = memoryview(buf).toreadonly()
+    definitions, chunks = split(buf, workers * chunks_per_worker)
+    if workers < 2 or len(chunks) < 2:
+        return list(Loader(**options).load_all(buf))
+
+    from concurrent.futures import ProcessPoolExecutor
+    from multiprocessing.shared_memory import SharedMemory
+
+    shared = SharedMemory(create=True, size=len(buf))
+    try:
+        shared.buf[:len(buf)] = buf
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [
+                pool.submit(_decode_chunk, shared.name, len(buf),
+                            [d for d in definitions if d[1] <= start],
+                            start, end, options)
+                for start, end in chunks]
+            values = []
+            for future in futures:
+                values.extend(future.result())
+        return values
+    finally:
+        shared.close()
+        shared.unlink()
+
+
+def split(buf, count):
+    """Find the messages in buf and cut them into about count chunks of
+    similar size. Returns the (start, end) ranges of the type definitions
+    and of the chunks. Chunks start at a value, so no chunk is made of
+    type definitions only.
+    """
+    definitions = []
+    values = []
+    for start, end, typeid in scan_segments(buf):
+        if typeid < 0:
+            definitions.append((start, end))
+        else:
+            values.append(start)
+
+    chunks = []
+    target = len(buf) / max(count, 1)
+    start = 0
+    for value_start in values:
+        if value_start - start >= target:
+            chunks.append((start, value_start))
+            start = value_start
+    if start < len(buf):
+        chunks.append((start, len(buf)))
+    return definitions, chunks
+
+
+def _decode_chunk(name, size, definitions, start, end, options):
+    """Decode the values between start and end of the shared buffer
+    called name, after the definitions that precede them.
+    """
+    from multiprocessing.shared_memory import SharedMemory
+
+    shared = SharedMemory(name=name)
+    buf = shared.buf[:size].toreadonly()
+    try:
+        loader = Loader(**options)
+        for definition_start, definition_end in definitions:
+            if definition_end > start:
+                break
+            loader._load_segment(
+                loader._read_segment(buf, definition_start)[0])
+        values = []
+        pos = start
+        while pos < end:
+            segment, pos = loader._read_segment(buf, pos)
+            found, value = loader._load_segment(segment)
+            if found:
+                values.append(value)
+        return values
+    finally:
+        # Views must be released before the mapping can be closed.
+        segment = None
+        buf.release()
+        shared.close()
@@ -0,0 +1,227 @@
+"""Decoding selected paths only.
+
+A selector is a dotted path through a value: struct field names, slice
+and array indexes, and '*' for every element of a slice or array or
+every value of a map. Loader.load(buf, select=[...]) decodes just the
+values at those paths and returns a dict keyed by selector. Everything
+else is skipped by length using the skip plans, so a large byte slice
+next to a selected field is never copied.
+
+Each '*' in a selector makes its result a list with one entry per
+element. Paths that do not exist in a value give None.
+"""
+
+from .types import GoUint, GoStruct, GoSlice, GoArray, GoMap
+
+# Key marking a node of the selector tree as selected as a whole.
+_WHOLE = None
+
+
+class BaseProjection:
+    """Decodes top-level values with projectors compiled by
+    compile_projector(loader, typeid) once per type id, see
+    Loader._load_segment.
+    """
+
+    def __init__(self):
+        # Projectors compiled for the loader's top-level types, checked
+        # against the type so that redefinitions are picked up.
+        self._projectors = {}
+
+    def projector(self, loader, typeid):
+        """Return the projector of typeid values, called as
+        project(buf, pos) and returning (result, pos).
+        """
+        go_type = loader.types.get(typeid)
+        cached = self._projectors.get(typeid)
+        if cached is None or cached[0] is not go_type:
+            cached = self._projectors[typeid] = (
+                go_type, self.compile_projector(loader, typeid))
+        return cached[1]
+
+
+class Projection(BaseProjection):
+    """A compiled set of selectors.
+
+    >>> from pygob import Loader, Dumper
+    >>> from typing import NamedTuple
+    >>> class Depot(NamedTuple):
+    ...     Id: int
+    ...     Manifest: bytes
+    >>> class App(NamedTuple):
+    ...     Appid: int
+    ...     Depots: list[Depot]
+    >>> buf = Dumper().dump(App(7, [Depot(1, b'x' * 100), Depot(2, b'')]))
+    >>> Loader().load(buf, select=['Appid', 'Depots.*.Id', 'Depots.1'])
+    {'Appid': 7, 'Depots.*.Id': [1, 2], \
+'Depots.1': Depot(Id=2, Manifest=bytearray(b''))}
+    """
+
+    def __init__(self, selectors):
+        super().__init__()
+        if isinstance(selectors, str):
+            selectors = [selectors]
+        self.selectors = [(s, s.split('.') if s else []) for s in selectors]
+        self._tree = {}
+        for _, parts in self.selectors:
+            node = self._tree
+            for part in parts:
+                node = node.setdefault(part, {})
+            node[_WHOLE] = True
+
+    def compile_projector(self, loader, typeid):
+        return _compile(loader, typeid, self._tree)
+
+    def project(self, loader, typeid, buf, pos=0):
+        """Decode the selected paths of the typeid value at pos. Returns
+        a dict keyed by selector and the position after the value.
+        """
+        result, pos = self.projector(loader, typeid)(buf, pos)
+        return {selector: _extract(result, parts)
+                for selector, parts in self.selectors}, pos
+
+
+def _compile(loader, typeid, node):
+    """Return a function projecting node out of a typeid value, called
+    as project(buf, pos) and returning (result, pos). A result is a dict
+    keyed like node, holding the whole value under _WHOLE.
+    """
+    if _WHOLE in node:
+        # The value is needed anyway: decode it and pick from it.
+        decode = loader.decoder(typeid)
+
+        def project(buf, pos):
+            value, pos = decode(buf, pos)
+            return _project_value(value, node), pos
+        return project
+
+    go_type = loader.types.get(typeid)
+    if isinstance(go_type, GoStruct):
+        return _compile_struct(loader, go_type, node)
+    if isinstance(go_type, (GoSlice, GoArray)):
+        return _compile_elements(loader, go_type, node)
+    if isinstance(go_type, GoMap):
+        return _compile_map(loader, go_type, node)
+
+    # Nothing to select inside a basic value.
+    skip = loader.skipper(typeid)
+
+    def project(buf, pos):
+        return {}, skip(buf, pos)
+    return project
+
+
+def _compile_struct(loader, go_type, node):
+    skips = [loader.skipper(typeid) for _, typeid in go_type._fields]
+    selected = {}
+    for index, (name, typeid) in enumerate(go_type._fields):
+        if name in node:
+            selected[index] = (name, _compile(loader, typeid, node[name]))
+
+    def project(buf, pos):
+        result = {}
+        field_id = -1
+        while True:
+            delta, pos = GoUint.decode(buf, pos)
+            if delta == 0:
+                break
+            field_id += delta
+            entry = selected.get(field_id)
+            if entry is None:
+                pos = skips[field_id](buf, pos)
+            else:
+                name, project_field = entry
+                result[name], pos = project_field(buf, pos)
+        if len(result) < len(selected):
+            # Go leaves out zero fields.
+            for index, (name, _) in selected.items():
+                if name not in result:
+                    result[name] = _project_value(
+                        go_type.field_zero(index), node[name])
+        return result, pos
+    return project
+
+
+def _compile_elements(loader, go_type, node):
+    elem = go_type._elem
+    skip = loader.skipper(elem)
+    every = _compile(loader, elem, node['*']) if '*' in node else None
+    indexes = {int(part): (part, _compile(loader, elem, child))
+               for part, child in node.items() if part.isdigit()}
+
+    def project(buf, pos):
+        result = {}
+        count, pos = GoUint.decode(buf, pos)
+        if every is not None:
+            elements = result['*'] = []
+        for i in range(count):
+            end = None
+            entry = indexes.get(i)
+            if entry is not None:
+                # Values can be read more than once, so an element
+                # selected by index and by '*' is projected twice.
+                part, project_index = entry
+                result[part], end = project_index(buf, pos)
+            if every is not None:
+                value, end = every(buf, pos)
+                elements.append(value)
+            pos = skip(buf, pos) if end is None else end
+        return result, pos
+    return project
+
+
+def _compile_map(loader, go_type, node):
+    skip_key = loader.skipper(go_type._key_typeid)
+    skip_elem = loader.skipper(go_type._elem_typeid)
+    every = (_compile(loader, go_type._elem_typeid, node['*'])
+             if '*' in node else None)
+
+    def project(buf, pos):
+        result = {}
+        count, pos = GoUint.decode(buf, pos)
+        if every is not None:
+            elements = result['*'] = []
+        for i in range(count):
+            pos = skip_key(buf, pos)
+            if every is None:
+                pos = skip_elem(buf, pos)
+            else:
+                value, pos = every(buf, pos)
+                elements.append(value)
+        return result, pos
+    return project
+
+
+def _project_value(value, node):
+    """Project node out of an already decoded value."""
+    result = {}
+    for part, child in node.items():
+        if part is _WHOLE:
+            result[_WHOLE] = value
+        elif part == '*':
+            if isinstance(value, dict):
+                value = value.values()
+            elif hasattr(value, '_fields') or not hasattr(value, '__iter__'):
+                continue
+            result['*'] = [_project_value(v, child) for v in value]
+        elif hasattr(value, '_fields'):
+            if part in value._fields:
+                result[part] = _project_value(getattr(value, part), child)
+        elif isinstance(value, dict):  # Loader(record='dict')
+            if part in value:
+                result[part] = _project_value(value[part], child)
+        elif part.isdigit() and hasattr(value, '__getitem__'):
+            if int(part) < len(value):
+                result[part] = _project_value(value[int(part)], child)
+    return result
+
+
+def _extract(result, parts):
+    """Pick the value of one selector out of a projection result."""
+    for i, part in enumerate(parts):
+        result = result.get(part)
+        if result is None:
+            return None
+        if part == '*':
+            return [_extract(r, parts[i + 1:]) for r in result]
+    return result.get(_WHOLE)
@@ -0,0 +1,220 @@
+"""Record classes for decoded structs.
+
+collections.namedtuple compiles the source of every class it creates
+with exec, which costs around a hundred microseconds per struct type.
+record_class builds an equivalent tuple subclass directly, so that
+loaders and the types in a stream are cheap to set up.
+
+Loader(record=...) can also decode structs into more compact or more
+convenient values than named tuples, see record_maker.
+"""
+
+from keyword import iskeyword
+from operator import itemgetter
+
+try:
+    from _collections import _tuplegetter
+except ImportError:  # pragma: no cover
+    def _tuplegetter(index, doc):
+        return property(itemgetter(index), doc=doc)
+
+
+def field_names(names):
+    """Rename invalid or duplicate field names like namedtuple does with
+    rename=True: they become an underscore followed by their position.
+
+    >>> field_names(['X', 'class', '_y', 'X', '1'])
+    ['X', '_1', '_2', '_3', '_4']
+    """
+    seen = set()
+    result = []
+    for index, name in enumerate(names):
+        if (not name.isidentifier() or iskeyword(name) or
+                name.startswith('_') or name in seen):
+            name = '_%d' % index
+        seen.add(name)
+        result.append(name)
+    return result
+
+
+def record_class(name, names):
+    """Create a namedtuple-like class called name with the given field
+    names, which are renamed as by field_names.
+
+    >>> Point = record_class('Point', ['X', 'Y'])
+    >>> p = Point(1, Y=2)
+    >>> p, p.X, p._asdict(), p._replace(X=3), Point._make([4, 5])
+    (Point(X=1, Y=2), 1, {'X': 1, 'Y': 2}, Point(X=3, Y=2), Point(X=4, Y=5))
+    """
+    fields = tuple(field_names(names))
+    count = len(fields)
+    tuple_new = tuple.__new__
+
+    def __new__(cls, *args, **kwargs):
+        if kwargs:
+            try:
+                args += tuple(kwargs.pop(field)
+                              for field in fields[len(args):])
+            except KeyError as missing:
+                raise TypeError('%s() missing field %s' % (name, missing))
+            if kwargs:
+                raise TypeError('%s() got unexpected field names: %r' %
+                                (name, list(kwargs)))
+        if len(args) != count:
+            raise TypeError('%s() takes %d arguments, got %d' %
+                            (name, count, len(args)))
+        return tuple_new(cls, args)
+
+    @classmethod
+    def _make(cls, iterable):
+        result = tuple_new(cls, iterable)
+        if len(result) != count:
+            raise TypeError('expected %d arguments, got %d' %
+                            (count, len(result)))
+        return result
+
+    def _replace(self, **kwargs):
+        result = self._make(map(kwargs.pop, fields, self))
+        if kwargs:
+            raise ValueError('got unexpected field names: %r' % list(kwargs))
+        return result
+
+    def _asdict(self):
+        return dict(zip(fields, self))
+
+    def __repr__(self):
+        return '%s(%s)' % (type(self).__name__, ', '.join(
+            '%s=%r' % item for item in zip(fields, self)))
+
+    def __getnewargs__(self):
+        return tuple(self)
+
+    def __reduce__(self):
+        # The class only exists in the process that decoded the value,
+        # so it is pickled by its name and fields.
+        return _rebuild, ('namedtuple', name, fields, tuple(self))
+
+    namespace = {
+        '__doc__': '%s(%s)' % (name, ', '.join(fields)),
+        '__slots__': (),
+        '_fields': fields,
+        '_field_defaults': {},
+        '__match_args__': fields,
+        '__new__': __new__,
+        '_make': _make,
+        '_replace': _replace,
+        '_asdict': _asdict,
+        '__repr__': __repr__,
+        '__getnewargs__': __getnewargs__,
+        '__reduce__': __reduce__,
+    }
+    for index, field in enumerate(fields):
+        namespace[field] = _tuplegetter(index, 'Field %s' % field)
+    return type(name, (tuple, ), namespace)
+
+
+def slots_class(name, names):
+    """Create a class called name whose instances keep the given fields,
+    renamed as by field_names, in __slots__. They take less memory than
+    tuples of the same size, are mutable and compare by value.
+
+    >>> Point = slots_class('Point', ['X', 'Y'])
+    >>> p = Point._make([1, 2])
+    >>> p.Y = 3
+    >>> p, p._asdict(), p == Point._make([1, 3])
+    (Point(X=1, Y=3), {'X': 1, 'Y': 3}, True)
+    """
+    fields = tuple(field_names(names))
+    new = object.__new__
+
+    def _make(cls, values):
+        self = new(cls)
+        for set_field, value in zip(setters, values):
+            set_field(self, value)
+        return self
+
+    def _asdict(self):
+        return {field: getattr(self, field) for field in fields}
+
+    def __iter__(self):
+        for field in fields:
+            yield getattr(self, field)
+
+    def __eq__(self, other):
+        # Redefining a type in a stream creates a new class, so compare
+        # the layout rather than the class.
+        if getattr(type(other), '__slots__', None) != fields:
+            return NotImplemented
+        return tuple(self) == tuple(other)
+
+    def __repr__(self):
+        return '%s(%s)' % (type(self).__name__, ', '.join(
+            '%s=%r' % item for item in zip(fields, self)))
+
+    def __reduce__(self):
+        return _rebuild, ('slots', name, fields, tuple(self))
+
+    cls = type(name, (), {
+        '__slots__': fields,
+        '_fields': fields,
+        '_make': classmethod(_make),
+        '_asdict': _asdict,
+        '__iter__': __iter__,
+        '__eq__': __eq__,
+        '__repr__': __repr__,
+        '__reduce__': __reduce__,
+    })
+    setters = [getattr(cls, field).__set__ for field in fields]
+    return cls
+
+
+def record_maker(record, cls, names):
+    """Return the function building a struct value from a list of field
+    values for the record kind, see Loader. cls is the record_class of
+    the struct and names its Go field names.
+
+    >>> Point = record_class('Point', ['X', 'Y'])
+    >>> [record_maker(record, Point, ['X', 'Y'])([1, 2])
+    ...  for record in ('namedtuple', 'tuple', 'dict')]
+    [Point(X=1, Y=2), (1, 2), {'X': 1, 'Y': 2}]
+    """
+    if record == 'namedtuple':
+        return cls._make
+    if record == 'slots':
+        return slots_class(cls.__name__, names)._make
+    if record == 'tuple':
+        return tuple
+    if record == 'dict':
+        names = tuple(names)
+        return lambda values: dict(zip(names, values))
+    raise ValueError('unknown record kind: %r' % record)
+
+
+# Classes created to unpickle records, keyed by kind, name and fields.
+_rebuilt = {}
+
+
+def _rebuild(kind, name, fields, values):
+    """Unpickle a record. Records of the same name and fields share one
+    class per process.
+
+    >>> import pickle
+    >>> Point = record_class('Point', ['X', 'Y'])
+    >>> p = pickle.loads(pickle.dumps(Point(1, 2)))
+    >>> p, type(p) is type(pickle.loads(pickle.dumps(Point(3, 4))))
+    (Point(X=1, Y=2), True)
+    """
+    key = (kind, name, fields)
+    cls = _rebuilt.get(key)
+    if cls is None:
+        factory = record_class if kind == 'namedtuple' else slots_class
+        cls = _rebuilt[key] = factory(name, fields)
+    return cls._make(values)
+
+
+# The record kinds structs can be decoded into, see Loader.
+RECORDS = ('namedtuple', 'slots', 'tuple', 'dict')
+
+# Record kinds whose values are immutable, so one zero value can be
+# shared by every struct that needs it.
+IMMUTABLE_RECORDS = frozenset(['namedtuple', 'tuple'])
@@ -0,0 +1,144 @@
+"""Per-type decode statistics.
+
+Instrumenting a loader wraps every decoder it hands out, so that each
+value decoded is counted under its type id, along with the bytes it
+took up and the time spent on it. Decoders are only wrapped while the
+loader is instrumented; otherwise nothing changes and nothing is
+counted.
+
+With Loader(iterative=True), values of recursive types are decoded by
+the stack engine without a call per value, see pygob.iterative. Only
+the outermost of them, and the values of other types nested in them,
+are counted; the ones nested in them are part of its bytes and time.
+"""
+
+from time import perf_counter
+
+from .dumper import TYPE_NAMES
+from .types import GoStruct, GoSlice, GoArray, GoMap
+
+
+def type_name(types, typeid):
+    """Return a Go-like name for typeid, such as []Depot."""
+    go_type = types.get(typeid)
+    if isinstance(go_type, GoStruct):
+        return go_type._name or type(go_type).__name__
+    if isinstance(go_type, GoSlice):
+        return '[]' + type_name(types, go_type._elem)
+    if isinstance(go_type, GoArray):
+        return '[%d]%s' % (go_type._length, type_name(types, go_type._elem))
+    if isinstance(go_type, GoMap):
+        return 'map[%s]%s' % (type_name(types, go_type._key_typeid),
+                              type_name(types, go_type._elem_typeid))
+    return TYPE_NAMES.get(typeid, str(typeid))
+
+
+class DecodeStats:
+    """Counters filled in while a loader is instrumented.
+
+    For every type id: the number of values decoded, the bytes they
+    took up, the total time spent decoding them including nested values,
+    and the self time excluding any nested values. Values of recursive
+    types nest in each other, so their total time counts some of it
+    more than once; self times always add up.
+
+    A type id that the stream redefines is counted apart for each of its
+    types, see snapshot().
+    """
+
+    def __init__(self):
+        # Counters by (typeid, GoType).
+        self.types = {}
+        self.definitions = 0
+        # Time spent in nested decoders of the value being decoded.
+        self._nested = 0.0
+
+    def wrap(self, typeid, go_type, name, decode):
+        """Return decode counting its values under typeid and go_type."""
+        key = (typeid, go_type)
+        counters = self.types.get(key)
+        if counters is None:
+            counters = self.types[key] = [name, 0, 0, 0.0, 0.0]
+
+        def counted(buf, pos=0):
+            outer = self._nested
+            self._nested = 0.0
+            start = perf_counter()
+            try:
+                value, end = decode(buf, pos)
+            finally:
+                elapsed = perf_counter() - start
+                counters[3] += elapsed
+                counters[4] += elapsed - self._nested
+                self._nested = outer + elapsed
+            counters[1] += 1
+            counters[2] += end - pos
+            return value, end
+        return counted
+
+    def snapshot(self):
+        """Return the counters as a dict, types sorted by self time.
+
+        Types are keyed by type id, or by (typeid, n) for the n-th type,
+        from 0, of a type id the stream redefined:
+
+        >>> from typing import NamedTuple
+        >>> from pygob import Loader, Dumper
+        >>> class A(NamedTuple):
+        ...     X: int
+        >>> class B(NamedTuple):
+        ...     Name: str
+        >>> loader = Loader()
+        >>> with loader.instrument():
+        ...     list(loader.load_all(Dumper().dump(A(1)) +
+        ...                          Dumper().dump(B('b'))))
+        [A(X=1), B(Name=b'b')]
+        >>> types = loader.stats()['types']
+        >>> sorted((key, types[key]['name'], types[key]['values'])
+        ...        for key in types if isinstance(key, tuple))
+        [((64, 0), 'A', 1), ((64, 1), 'B', 1)]
+        """
+        generations = {}
+        keys = {}
+        for typeid, go_type in self.types:
+            keys[typeid, go_type] = (typeid, generations.get(typeid, 0))
+            generations[typeid] = generations.get(typeid, 0) + 1
+        for key, (typeid, n) in keys.items():
+            if generations[typeid] == 1:
+                keys[key] = typeid
+        types = sorted(self.types.items(), key=lambda item: -item[1][4])
+        return {
+            'definitions': self.definitions,
+            'types': {keys[key]: {'name': name, 'values': values,
+                                  'bytes': size, 'time': total,
+                                  'self_time': own}
+                      for key, (name, values, size, total, own) in types},
+        }
+
+    def report(self):
+        """Return the counters as a table, slowest types first."""
+        lines = ['%6s %-24s %10s %12s %10s %10s' % (
+            'typeid', 'name', 'values', 'bytes', 'time ms', 'self ms')]
+        for key, entry in self.snapshot()['types'].items():
+            if isinstance(key, tuple):
+                key = '%d/%d' % key
+            lines.append('%6s %-24s %10d %12d %10.2f %10.2f' % (
+                key, entry['name'][:24], entry['values'], entry['bytes'],
+                entry['time'] * 1e3, entry['self_time'] * 1e3))
+        lines.append('%d type definitions registered' % self.definitions)
+        return '\n'.join(lines)
+
+
+class Instrumented:
+    """Context manager instrumenting a loader, see Loader.instrument."""
+
+    def __init__(self, loader, stats):
+        self._loader = loader
+        self._stats = stats
+
+    def __enter__(self):
+        self._loader._set_stats(self._stats)
+        return self._stats
+
+    def __exit__(self, *exc_info):
+        self._loader._set_stats(None)
@@ -0,0 +1,55 @@
+from .dumper import Dumper
+
+
+class StreamEncoder(Dumper):
+    """Writes values to a binary file object as one gob stream.
+
+    Type definitions are sent only the first time a type is used.
+    Segments are appended straight to a write buffer which is handed to
+    the file object whenever it reaches buffer_size bytes, and on
+    flush(). Leaving a with block flushes too:
+
+    >>> import io
+    >>> out = io.BytesIO()
+    >>> with StreamEncoder(out) as encoder:
+    ...     encoder.write([1, 2])
+    ...     encoder.write([3])
+    >>> from pygob import load_all
+    >>> list(load_all(out.getvalue()))
+    [[1, 2], [3]]
+    """
+
+    def __init__(self, fileobj, buffer_size=64 * 1024, types=None):
+        super().__init__(types)
+        self.fileobj = fileobj
+        self.buffer_size = buffer_size
+        self._buffer = bytearray()
+
+    def write(self, value):
+        """Encode value into the stream."""
+        self._dump_into(self._buffer, value)
+        if len(self._buffer) >= self.buffer_size:
+            self._write_buffer()
+
+    def write_all(self, values):
+        """Encode every value in an iterable into the stream."""
+        for value in values:
+            self.write(value)
+
+    def flush(self):
+        """Write out everything encoded so far and flush the file object."""
+        self._write_buffer()
+        flush = getattr(self.fileobj, 'flush', None)
+        if flush is not None:
+            flush()
+
+    def _write_buffer(self):
+        if self._buffer:
+            self.fileobj.write(self._buffer)
+            self._buffer.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.flush()
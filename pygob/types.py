@@ -5,8 +5,10 @@ already agree on to bootstrap the protocol.
 """
 
 import struct
-import collections
-import itertools
+import threading
+
+from .lazy import LazyStruct
+from .records import record_class, record_maker, IMMUTABLE_RECORDS
 
 # We do not use an Enum for this since this set isn't the full set of
 # all type IDs -- the protocol allows a sender to define custom IDs in
@@ -34,6 +36,12 @@ GOB_ENCODER_TYPE = -1
 BINARY_MARSHALER_TYPE = -2
 TEXT_MARSHALER_TYPE = -3
 
+# Encoded forms of the single byte unsigned integers, which make up
+# most deltas, lengths and small values in a stream.
+_SMALL_UINTS = [bytes([n]) for n in range(128)]
+
+_from_bytes = int.from_bytes
+
 
 class classproperty(object):
     def __init__(self, fget):
@@ -43,13 +51,62 @@ class classproperty(object):
         return self.fget(owner_cls)
 
 
+def run_decoder(decode):
+    """Turn a decode function into one that decodes a run of count
+    consecutive values, returning a list of them and the position after
+    the run. Types with a faster way of doing this define decode_run.
+    """
+    def decode_run(buf, pos, count):
+        result = []
+        append = result.append
+        for _ in range(count):
+            value, pos = decode(buf, pos)
+            append(value)
+        return result, pos
+    return decode_run
+
+
+def appender(go_type):
+    """Return a function called as append(out, value) which appends the
+    encoding of value to the bytearray out. Compound types provide
+    encode_into for this, basic types only have encode.
+    """
+    encode_into = getattr(go_type, 'encode_into', None)
+    if encode_into is not None:
+        return encode_into
+    encode = go_type.encode
+
+    def append(out, value):
+        out += encode(value)
+    return append
+
+
+def is_zero(value):
+    """Check if value is the zero value of its type, which Go does not
+    send for struct fields."""
+    try:
+        return not value
+    except ValueError:  # NumPy arrays have no truth value
+        return len(value) == 0
+
+
 class GoType:
     """Represents a Go type.
 
     Go types know how to decode a gob stream to their corresponding
     Python type.
     """
-    pass
+    _plan = None
+
+    _encode_plan = None
+
+    _skip_plan = None
+
+    def invalidate(self):
+        """Forget the compiled plans, see Loader.register."""
+        self._plan = None
+        self._encode_plan = None
+        self._skip_plan = None
 
 
 class GoBool(GoType):
@@ -62,17 +119,21 @@ class GoBool(GoType):
     zero = False
 
     @staticmethod
-    def decode(buf):
-        """Decode a Boolean from buf. Returns the Boolean and the remainder of
-        the buffer:
+    def decode(buf, pos=0):
+        """Decode a Boolean from buf at pos. Returns the Boolean and the
+        position just after it:
 
         >>> GoBool.decode(bytes([0]))
-        (False, b'')
+        (False, 1)
         >>> GoBool.decode(bytes([1]))
-        (True, b'')
+        (True, 1)
         """
-        n, buf = GoUint.decode(buf)
-        return n == 1, buf
+        n, pos = GoUint.decode(buf, pos)
+        return n == 1, pos
+
+    @staticmethod
+    def skip(buf, pos=0):
+        return GoUint.skip(buf, pos)
 
     @staticmethod
     def encode(b):
@@ -96,25 +157,63 @@ class GoUint(GoType):
     zero = 0
 
     @staticmethod
-    def decode(buf):
-        """Decode an unsigned integer from buf. Returns the integer and the
-        remainder of the buffer:
+    def decode(buf, pos=0):
+        """Decode an unsigned integer from buf at pos. Returns the integer
+        and the position just after it:
 
         >>> GoUint.decode(bytes([56]))
-        (56, b'')
+        (56, 1)
         >>> GoUint.decode(bytes([254, 1, 0]))
-        (256, b'')
+        (256, 3)
+        >>> GoUint.decode(bytes([7, 254, 1, 0]), 1)
+        (256, 4)
         """
-        if buf[0] < 128:  # small uint in a single byte
-            return buf[0], buf[1:]
+        b = buf[pos]
+        if b < 128:  # small uint in a single byte
+            return b, pos + 1
+
+        # larger uint split over multiple bytes, big endian
+        end = pos + 257 - b
+        return _from_bytes(buf[pos + 1:end], 'big'), end
 
-        # larger uint split over multiple bytes
-        length = 256 - buf[0]
-        n = 0
-        for b in buf[1:length]:
-            n = (n + b) << 8
-        n += buf[length]
-        return n, buf[length + 1:]
+    @staticmethod
+    def skip(buf, pos=0):
+        """Return the position after the unsigned integer at pos, without
+        decoding it:
+
+        >>> GoUint.skip(bytes([254, 1, 0]))
+        3
+        """
+        b = buf[pos]
+        if b < 128:
+            return pos + 1
+        return pos + 257 - b
+
+    @staticmethod
+    def decode_run(buf, pos, count):
+        """Decode count consecutive unsigned integers from buf at pos.
+        Returns a list of the integers and the position after them:
+
+        >>> GoUint.decode_run(bytes([1, 2, 254, 1, 0]), 0, 3)
+        ([1, 2, 256], 5)
+        """
+        chunk = bytes(buf[pos:pos + count])
+        if chunk.isascii():
+            # Every value fits in a single byte.
+            return list(chunk), pos + count
+
+        result = []
+        append = result.append
+        for _ in range(count):
+            b = buf[pos]
+            if b < 128:
+                append(b)
+                pos += 1
+            else:
+                end = pos + 257 - b
+                append(_from_bytes(buf[pos + 1:end], 'big'))
+                pos = end
+        return result, pos
 
     @staticmethod
     def encode(n):
@@ -125,17 +224,14 @@ class GoUint(GoType):
         >>> list(GoUint.encode(256))
         [254, 1, 0]
         """
-        if n < 0:
-            raise ValueError('negative number for GoUint.encode: %s' % n)
         if n < 128:
-            return bytes([n])
-        else:
-            encoded = []
-            while n:
-                encoded.append(n & 0xFF)
-                n = n >> 8
-            encoded.append(256 - len(encoded))
-            return bytes(reversed(encoded))
+            if n < 0:
+                raise ValueError('negative number for GoUint.encode: %s' % n)
+            return _SMALL_UINTS[n]
+        # NumPy integers have no bit_length or to_bytes.
+        n = int(n)
+        length = (n.bit_length() + 7) >> 3
+        return bytes((256 - length, )) + n.to_bytes(length, 'big')
 
 
 class GoInt(GoType):
@@ -148,19 +244,40 @@ class GoInt(GoType):
     zero = 0
 
     @staticmethod
-    def decode(buf):
-        """Decode a signed integer from buf. Returns the integer and the
-        remainder of the buffer:
+    def decode(buf, pos=0):
+        """Decode a signed integer from buf at pos. Returns the integer and
+        the position just after it:
 
         >>> GoInt.decode(bytes([5]))
-        (-3, b'')
+        (-3, 1)
         >>> GoInt.decode(bytes([6]))
-        (3, b'')
+        (3, 1)
         """
-        uint, buf = GoUint.decode(buf)
+        uint = buf[pos]
+        if uint < 128:
+            pos += 1
+        else:
+            end = pos + 257 - uint
+            uint = _from_bytes(buf[pos + 1:end], 'big')
+            pos = end
         if uint & 1:
             uint = ~uint
-        return uint >> 1, buf
+        return uint >> 1, pos
+
+    @staticmethod
+    def skip(buf, pos=0):
+        return GoUint.skip(buf, pos)
+
+    @staticmethod
+    def decode_run(buf, pos, count):
+        """Decode count consecutive signed integers from buf at pos.
+        Returns a list of the integers and the position after them:
+
+        >>> GoInt.decode_run(bytes([5, 6, 254, 1, 0]), 0, 3)
+        ([-3, 3, 128], 5)
+        """
+        uints, pos = GoUint.decode_run(buf, pos, count)
+        return [~u >> 1 if u & 1 else u >> 1 for u in uints], pos
 
     @staticmethod
     def encode(n):
@@ -171,6 +288,9 @@ class GoInt(GoType):
         >>> list(GoInt.encode(3))
         [6]
         """
+        if type(n) is not int:
+            # NumPy integers would overflow on the shifts below.
+            n = int(n)
         if n < 0:
             uint = (~n << 1) | 1
         else:
@@ -188,19 +308,37 @@ class GoFloat(GoType):
     zero = 0.0
 
     @staticmethod
-    def decode(buf):
-        """Decode a 64-bit floating point number from buf. Returns the float
-        and the remainder of the buffer:
+    def decode(buf, pos=0):
+        """Decode a 64-bit floating point number from buf at pos. Returns
+        the float and the position just after it:
 
         >>> GoFloat.decode(bytes([0]))
-        (0.0, b'')
+        (0.0, 1)
         >>> GoFloat.decode(bytes([254, 244, 63]))
-        (1.25, b'')
+        (1.25, 3)
         """
-        n, buf = GoUint.decode(buf)
+        n, pos = GoUint.decode(buf, pos)
         rev = struct.pack('>Q', n)
         (f, ) = struct.unpack('<d', rev)
-        return f, buf
+        return f, pos
+
+    @staticmethod
+    def skip(buf, pos=0):
+        return GoUint.skip(buf, pos)
+
+    @staticmethod
+    def decode_run(buf, pos, count):
+        """Decode count consecutive floats from buf at pos. Returns a list
+        of the floats and the position after them:
+
+        >>> GoFloat.decode_run(bytes([0, 254, 244, 63]), 0, 2)
+        ([0.0, 1.25], 4)
+        """
+        uints, pos = GoUint.decode_run(buf, pos, count)
+        # Byte-reversing each 64-bit word turns the whole run into
+        # little endian doubles in one go.
+        rev = struct.pack('>%dQ' % count, *uints)
+        return list(struct.unpack('<%dd' % count, rev)), pos
 
     @staticmethod
     def encode(f):
@@ -221,9 +359,9 @@ class GoFloat(GoType):
         are valid ways of representing a IEEE 754 NaN value:
 
         >>> GoFloat.decode(bytes([248, 1, 0, 0, 0, 0, 0, 248, 127]))
-        (nan, b'')
+        (nan, 9)
         >>> GoFloat.decode(bytes([254, 248, 127]))
-        (nan, b'')
+        (nan, 3)
 
         They only differ in the so-called "payload" of the value,
         which is ignored in most applications.
@@ -247,15 +385,40 @@ class GoByteSlice(GoType):
         return bytearray()
 
     @staticmethod
-    def decode(buf):
-        """Decode a byte slice from buf. Returns the slice and the remainder
-        of the buffer:
+    def decode(buf, pos=0):
+        """Decode a byte slice from buf at pos. Returns the slice and the
+        position just after it:
 
         >>> GoByteSlice.decode(bytes([5, 104, 101, 108, 108, 111]))
-        (bytearray(b'hello'), b'')
+        (bytearray(b'hello'), 6)
+        """
+        count, pos = GoUint.decode(buf, pos)
+        end = pos + count
+        return bytearray(buf[pos:end]), end
+
+    @staticmethod
+    def skip(buf, pos=0):
+        """Return the position after the byte slice at pos, without
+        copying it:
+
+        >>> GoByteSlice.skip(bytes([5, 104, 101, 108, 108, 111]))
+        6
+        """
+        count, pos = GoUint.decode(buf, pos)
+        return pos + count
+
+    @staticmethod
+    def decode_view(buf, pos=0):
+        """Like decode, but return a slice of buf instead of a bytearray.
+        When buf is a memoryview, the slice is a view and not a copy:
+
+        >>> view, pos = GoByteSlice.decode_view(memoryview(b'\\x02hi'))
+        >>> view.tobytes(), pos
+        (b'hi', 3)
         """
-        count, buf = GoUint.decode(buf)
-        return bytearray(buf[:count]), buf[count:]
+        count, pos = GoUint.decode(buf, pos)
+        end = pos + count
+        return buf[pos:end], end
 
     @staticmethod
     def encode(buf):
@@ -278,18 +441,21 @@ class GoString(GoType):
     zero = b''
 
     @staticmethod
-    def decode(buf):
-        """Decode a string from buf. Since Go strings do not guarantee any
-        particular encoding, the data is returned as bytes:
+    def decode(buf, pos=0):
+        """Decode a string from buf at pos. Since Go strings do not
+        guarantee any particular encoding, the data is returned as bytes:
 
         >>> GoString.decode(bytes([5, 104, 101, 108, 108, 111]))
-        (b'hello', b'')
+        (b'hello', 6)
         """
-        count, buf = GoUint.decode(buf)
-        # TODO: Go strings do not guarantee any particular encoding.
-        # Add support for trying to decode the bytes using, say,
-        # UTF-8, so we can return a real Python string.
-        return buf[:count], buf[count:]
+        count, pos = GoUint.decode(buf, pos)
+        end = pos + count
+        # Loader(strings='str') decodes UTF-8, see GoText.
+        return bytes(buf[pos:end]), end
+
+    decode_view = GoByteSlice.decode_view
+
+    skip = GoByteSlice.skip
 
     @staticmethod
     def encode(s):
@@ -299,8 +465,85 @@ class GoString(GoType):
 
         >>> GoString.encode('alpha: α')
         b'\\talpha: \\xce\\xb1'
+
+        Bytes, as returned by decode, are sent as they are where the
+        type is known to be a string, such as fields annotated str:
+
+        >>> GoString.encode(b'alpha')
+        b'\\x05alpha'
         """
-        return GoByteSlice.encode(s.encode('utf-8'))
+        if isinstance(s, str):
+            s = s.encode('utf-8')
+        return GoByteSlice.encode(s)
+
+
+# Strings longer than this are never interned, they rarely repeat.
+INTERN_MAX_LENGTH = 256
+
+
+class GoText(GoType):
+    """A Go string as decoded by Loader(strings='str') or with intern.
+
+    With text, strings are decoded as UTF-8, and those that are not
+    valid UTF-8 are returned as bytes. With intern,
+    a table maps the encoded form of each short string seen to the one
+    value returned for it, so repeated strings share one object and are
+    decoded once. The table holds at most intern_size strings; once it
+    is full, new strings are decoded without being added.
+
+    >>> text = GoText(intern=True)
+    >>> a, _ = text.decode(b'\\x02hi')
+    >>> b, _ = text.decode(b'\\x02hi')
+    >>> a, a is b, text.decode(b'\\x01\\xff')
+    ('hi', True, (b'\\xff', 2))
+    >>> text.decode(memoryview(bytearray(b'\\x02hi')))[0] is a
+    True
+    """
+    typeid = STRING
+    zero = ''
+
+    def __init__(self, intern=False, intern_size=100000, text=True):
+        self._text = text
+        if intern:
+            self._table = {}
+            self._intern_size = intern_size
+            self.decode = self._decode_interned
+        if not text:
+            self.zero = b''
+
+    def decode(self, buf, pos=0):
+        count, pos = GoUint.decode(buf, pos)
+        end = pos + count
+        return self._convert(buf[pos:end]), end
+
+    def _decode_interned(self, buf, pos=0):
+        count, pos = GoUint.decode(buf, pos)
+        end = pos + count
+        key = buf[pos:end]
+        if count > INTERN_MAX_LENGTH:
+            return self._convert(key), end
+        try:
+            value = self._table.get(key)
+        except (TypeError, ValueError):  # writable buffers cannot be hashed
+            key = bytes(key)
+            value = self._table.get(key)
+        if value is None:
+            value = self._convert(key)
+            if len(self._table) < self._intern_size:
+                self._table[bytes(key)] = value
+        return value, end
+
+    def _convert(self, data):
+        if self._text:
+            try:
+                return str(data, 'utf-8')
+            except UnicodeDecodeError:
+                pass
+        return bytes(data)
+
+    skip = staticmethod(GoByteSlice.skip)
+
+    encode = staticmethod(GoString.encode)
 
 
 class GoComplex(GoType):
@@ -313,16 +556,20 @@ class GoComplex(GoType):
     zero = 0 + 0j
 
     @staticmethod
-    def decode(buf):
-        """Decode a complex number from `buf`. Returns the number and the
-        remainder of the buffer:
+    def decode(buf, pos=0):
+        """Decode a complex number from `buf` at `pos`. Returns the number
+        and the position just after it:
 
         >>> GoComplex.decode(bytes([0, 254, 244, 63]))
-        (1.25j, b'')
+        (1.25j, 4)
         """
-        re, buf = GoFloat.decode(buf)
-        im, buf = GoFloat.decode(buf)
-        return complex(re, im), buf
+        re, pos = GoFloat.decode(buf, pos)
+        im, pos = GoFloat.decode(buf, pos)
+        return complex(re, im), pos
+
+    @staticmethod
+    def skip(buf, pos=0):
+        return GoUint.skip(buf, GoUint.skip(buf, pos))
 
     @staticmethod
     def encode(z):
@@ -334,23 +581,25 @@ class GoComplex(GoType):
         return GoFloat.encode(z.real) + GoFloat.encode(z.imag)
 
 
+# The structs whose zero value the current thread is building, see
+# GoStruct._with_fresh_zeros.
+_building = threading.local()
+
+
 class GoStruct(GoType):
     """A Go struct.
 
-    Go structs are mapped to Python named tuples.
+    Go structs are mapped to Python named tuples, or to the record kind
+    chosen with Loader(record=...).
     """
 
     @property
     def zero(self):
-        values = []
-        for _, t in self._fields:
-            type_ = self._loader.types[t]
-            if type_ == self:
-                # avoid infinite recursion with recursive types
-                values.append(None)
-            else:
-                values.append(type_.zero)
-        return self._class._make(values)
+        if self._zero is None:
+            self.compile()
+        if self._fresh or not self._shared_zero:
+            return self._with_fresh_zeros(list(self._zeros))
+        return self._zero
 
     def __init__(self, typeid, name, loader, fields):
         """A Go struct with a certain set of fields.
@@ -375,37 +624,203 @@ class GoStruct(GoType):
             loader.types[typeid] = self
         self._loader = loader
         self._fields = fields
+        self._plan = None
+        self._zero = None
+        self._zeros = None
+        self._fresh = ()
         if name.__contains__(' '):
             name = type(self).__name__
-        self._class = collections.namedtuple(name, [n for (n, t) in fields], rename=True)
-
-    def decode(self, buf):
-        """Decode data from buf and return a namedtuple."""
-        values = {}
+        self._class = record_class(name, [n for (n, t) in fields])
+        record = getattr(loader, '_record', 'namedtuple')
+        self._make = record_maker(record, self._class,
+                                  [n for (n, t) in fields])
+        self._shared_zero = record in IMMUTABLE_RECORDS
+        self._index = {name: index
+                       for index, name in enumerate(self._class._fields)}
+
+    def invalidate(self):
+        super().invalidate()
+        self._zero = None
+
+    def compile(self):
+        """Resolve the decoder of every field once and cache the zero
+        value. Returns the plan: a tuple of decoders indexed by field
+        number.
+        """
+        plan = tuple(self._loader.decoder(typeid)
+                     for _, typeid in self._fields)
+
+        # The placeholder stops mutually recursive structs from
+        # computing each other's zero value forever.
+        self._zeros = (None, ) * len(self._fields)
+        self._zero = self._make(self._zeros)
+        self._fresh = ()
+        types = self._loader.types
+        values = []
+        fresh = []
+        for index, (_, typeid) in enumerate(self._fields):
+            type_ = types[typeid]
+            if type_ is self:
+                # avoid infinite recursion with recursive types
+                values.append(None)
+                continue
+            zero = type_.zero
+            if zero is not type_.zero:
+                # Mutable zeros such as bytearray() cannot be shared
+                # between values, these are created anew each time.
+                fresh.append((index, type_))
+            values.append(zero)
+        self._zeros = tuple(values)
+        self._zero = self._make(values)
+        self._fresh = tuple(fresh)
+        self._plan = plan
+        self._loader.compiled(self)
+        return plan
+
+    def compile_skipper(self):
+        """Resolve how to skip every field once and return the plan: a
+        tuple of skip functions indexed by field number.
+        """
+        self._skip_plan = tuple(self._loader.skipper(typeid)
+                                for _, typeid in self._fields)
+        self._loader.compiled(self)
+        return self._skip_plan
+
+    def _with_fresh_zeros(self, values):
+        # Types can be shared by loaders in several threads, see
+        # TypeCache, so each thread keeps its own structs being built.
+        building = getattr(_building, 'structs', None)
+        if building is None:
+            building = _building.structs = set()
+        if self in building:
+            # Mutually recursive structs with mutable zeros would build
+            # each other's zero forever; share them below this level.
+            return self._make(values)
+        zeros = self._zeros
+        building.add(self)
+        try:
+            for index, type_ in self._fresh:
+                if values[index] is zeros[index]:
+                    values[index] = type_.zero
+        finally:
+            building.discard(self)
+        return self._make(values)
+
+    def field_zero(self, index):
+        """Return the zero value of the field at index, a new one if it
+        is mutable."""
+        if self._zero is None:
+            self.compile()
+        for fresh_index, type_ in self._fresh:
+            if fresh_index == index:
+                return type_.zero
+        return self._zeros[index]
+
+    def decode(self, buf, pos=0):
+        """Decode data from buf at pos and return a namedtuple."""
+        plan = self._plan
+        if plan is None:
+            plan = self.compile()
+        values = list(self._zeros)
         field_id = -1
         while True:
-            delta, buf = GoUint.decode(buf)
+            delta, pos = GoUint.decode(buf, pos)
             if delta == 0:
                 break
             field_id += delta
-            name, typeid = self._fields[field_id]
-            value, buf = self._loader.types[typeid].decode(buf)
-            values[name] = value
-        return self.zero._replace(**values), buf
+            values[field_id], pos = plan[field_id](buf, pos)
+        if self._fresh:
+            return self._with_fresh_zeros(values), pos
+        return self._make(values), pos
+
+    def decode_lazy(self, buf, pos=0):
+        """Decode data from buf at pos into a LazyStruct. Only the field
+        offsets are read, the fields themselves are skipped over and
+        decoded when they are first accessed.
+        """
+        plan = self._plan
+        if plan is None:
+            plan = self.compile()
+        skips = self._skip_plan
+        if skips is None:
+            skips = self.compile_skipper()
+        offsets = [None] * len(skips)
+        field_id = -1
+        while True:
+            delta, pos = GoUint.decode(buf, pos)
+            if delta == 0:
+                break
+            field_id += delta
+            offsets[field_id] = pos
+            pos = skips[field_id](buf, pos)
+        return LazyStruct(self, plan, buf, offsets), pos
+
+    def skip(self, buf, pos=0):
+        """Return the position after the struct at pos."""
+        skips = self._skip_plan
+        if skips is None:
+            skips = self.compile_skipper()
+        field_id = -1
+        while True:
+            delta, pos = GoUint.decode(buf, pos)
+            if delta == 0:
+                return pos
+            field_id += delta
+            pos = skips[field_id](buf, pos)
+
+    def compile_encoder(self):
+        """Resolve how to encode every field once and return the plan: a
+        tuple of (append, always) pairs indexed by field number.
+
+        Like Go, fields holding a zero value are left out, except for
+        structs and arrays which are always sent.
+        """
+        plan = []
+        for _, typeid in self._fields:
+            field_type = self._loader.types[typeid]
+            always = isinstance(field_type, (GoStruct, GoArray))
+            plan.append((appender(field_type), always))
+        self._encode_plan = tuple(plan)
+        return self._encode_plan
 
     def encode(self, values):
-        buf = bytearray()
-        delta = 1
-        for field, value in itertools.zip_longest(self._fields, values, fillvalue=None):
-            if value == None:
-                delta += 1
+        """Encode values, which is a namedtuple or sequence of field values
+        in order, a dict keyed by field name, or an object with the
+        fields as attributes. Fields that are None are not sent:
+
+        >>> from pygob import Loader
+        >>> person = GoStruct(142, 'Person', Loader(), [
+        ...     ('Name', STRING),
+        ...     ('Age', INT),
+        ... ])
+        >>> list(person.encode(person._class(b'Al', 0)))
+        [1, 2, 65, 108, 0]
+        >>> list(person.encode({'Age': 3}))
+        [2, 6, 0]
+        """
+        out = bytearray()
+        self.encode_into(out, values)
+        return out
+
+    def encode_into(self, out, values):
+        plan = self._encode_plan
+        if plan is None:
+            plan = self.compile_encoder()
+        if isinstance(values, dict):
+            values = [values.get(name) for name, _ in self._fields]
+        elif not isinstance(values, (tuple, list)):
+            values = [getattr(values, name, None)
+                      for name, _ in self._fields]
+
+        last = -1
+        for field_id, (value, (append, always)) in enumerate(
+                zip(values, plan)):
+            if value is None or (not always and is_zero(value)):
                 continue
-            buf.extend(GoUint.encode(delta))
-            field_type = self._loader.types[field[1]]
-            buf.extend(field_type.encode(value))
-            delta = 1
-        buf.extend(GoUint.encode(0))
-        return buf
+            out += GoUint.encode(field_id - last)
+            append(out, value)
+            last = field_id
+        out.append(0)
 
     def __repr__(self):
         """GoStruct representation.
@@ -425,51 +840,57 @@ class GoWireType(GoStruct):
     can be used later to decode actual values of the custom type.
     """
 
-    def decode(self, buf):
-        """Decode data from buf and return a GoType."""
-        wire_type, buf = super().decode(buf)
+    def decode(self, buf, pos=0, loader=None):
+        """Decode data from buf at pos and return a GoType. The type is
+        registered with loader, which defaults to our own.
+        """
+        if loader is None:
+            loader = self._loader
+        wire_type, pos = super().decode(buf, pos)
+        # The cached zero holds the zero value of every field.
+        zero = self._zero
 
-        if wire_type.ArrayT != self._loader.types[ARRAY_TYPE].zero:
+        if wire_type.ArrayT != zero.ArrayT:
             typeid = wire_type.ArrayT.CommonType.Id
             elem = wire_type.ArrayT.Elem
             length = wire_type.ArrayT.Len
-            return GoArray(typeid, self._loader, elem, length), buf
+            return GoArray(typeid, loader, elem, length), pos
 
-        if wire_type.SliceT != self._loader.types[SLICE_TYPE].zero:
+        if wire_type.SliceT != zero.SliceT:
             typeid = wire_type.SliceT.CommonType.Id
             elem = wire_type.SliceT.Elem
-            return GoSlice(typeid, self._loader, elem), buf
+            return GoSlice(typeid, loader, elem), pos
 
-        if wire_type.StructT != self._loader.types[STRUCT_TYPE].zero:
+        if wire_type.StructT != zero.StructT:
             typeid = wire_type.StructT.CommonType.Id
             # Named tuples must be constructed using strings, not
             # bytes, so we need to decode the names here. Go source
             # files are defined to be UTF-8 encoded.
-            name = wire_type.StructT.CommonType.Name.decode('utf-8')
-            fields = [(f.Name.decode('utf-8'), f.Id)
+            name = str(wire_type.StructT.CommonType.Name, 'utf-8')
+            fields = [(str(f.Name, 'utf-8'), f.Id)
                       for f in wire_type.StructT.Field]
-            return GoStruct(typeid, name, self._loader, fields), buf
+            return GoStruct(typeid, name, loader, fields), pos
 
-        if wire_type.MapT != self._loader.types[MAP_TYPE].zero:
+        if wire_type.MapT != zero.MapT:
             typeid = wire_type.MapT.CommonType.Id
             key_typeid = wire_type.MapT.Key
             elem_typeid = wire_type.MapT.Elem
-            return GoMap(typeid, self._loader, key_typeid, elem_typeid), buf
+            return GoMap(typeid, loader, key_typeid, elem_typeid), pos
 
-        if wire_type.GobEncoderT != self._loader.types[GOB_ENCODER_TYPE].zero:
+        if wire_type.GobEncoderT != zero.GobEncoderT:
             typeid = wire_type.GobEncoderT.CommonType.Id
-            name = wire_type.GobEncoderT.CommonType.Name.decode('utf-8')
-            return GoGobEncoder(typeid, self._loader), buf
+            name = str(wire_type.GobEncoderT.CommonType.Name, 'utf-8')
+            return GoGobEncoder(typeid, loader), pos
 
-        if wire_type.BinaryMarshalerT != self._loader.types[BINARY_MARSHALER_TYPE].zero:
-            typeid = wire_type.BinaryMarshalerT.GobEncoderT.CommonType.Id
-            name = wire_type.BinaryMarshalerT.GobEncoderT.CommonType.Name.decode('utf-8')
-            return GoBinaryMarshaler(typeid, self._loader), buf
+        if wire_type.BinaryMarshalerT != zero.BinaryMarshalerT:
+            typeid = wire_type.BinaryMarshalerT.CommonType.Id
+            name = str(wire_type.BinaryMarshalerT.CommonType.Name, 'utf-8')
+            return GoBinaryMarshaler(typeid, loader), pos
 
-        if wire_type.TextMarshalerT != self._loader.types[TEXT_MARSHALER_TYPE].zero:
-            typeid = wire_type.TextMarshalerT.GobEncoderT.CommonType.Id
-            name = wire_type.TextMarshalerT.GobEncoderT.CommonType.Name.decode('utf-8')
-            return GoTextMarshaler(typeid, self._loader), buf
+        if wire_type.TextMarshalerT != zero.TextMarshalerT:
+            typeid = wire_type.TextMarshalerT.CommonType.Id
+            name = str(wire_type.TextMarshalerT.CommonType.Name, 'utf-8')
+            return GoTextMarshaler(typeid, loader), pos
 
         raise NotImplementedError("cannot handle %s" % wire_type)
 
@@ -496,30 +917,79 @@ class GoArray(GoType):
         self._loader = loader
         self._elem = elem
         self._length = length
+        self._plan = None
+
+    def compile(self):
+        """Resolve the decoder for runs of elements once and return it."""
+        self._plan = self._loader.run_decoder(self._elem)
+        self._loader.compiled(self)
+        return self._plan
 
-    def decode(self, buf):
-        """Decode data from buf and return a tuple.
+    def skip(self, buf, pos=0):
+        """Return the position after the elements at pos."""
+        return _skip_elements(self, buf, pos)
+
+    def decode(self, buf, pos=0):
+        """Decode data from buf at pos and return a tuple.
 
         Go arrays have a fixed size and cannot be resized. This makes
         them more like Python tuples than Python lists.
         """
-        count, buf = GoUint.decode(buf)
+        decode_run = self._plan
+        if decode_run is None:
+            decode_run = self.compile()
+        count, pos = GoUint.decode(buf, pos)
         assert count == self._length, \
             "expected %d elements, found %d" % (self._length, count)
 
-        result = []
-        for i in range(count):
-            value, buf = self._loader.decode_value(self._elem, buf)
-            result.append(value)
-        return tuple(result), buf
+        result, pos = decode_run(buf, pos, count)
+        if type(result) is list:
+            result = tuple(result)
+        return result, pos
 
     def encode(self, values):
-        buf = bytearray()
-        buf.extend(GoUint.encode(len(value)))
-        for value in values:
-            go_type = self._loader.python_types.get(type(value))
-            buf.extend(go_type.encode(value))
-        return buf
+        """Encode a sequence of values as a Go array:
+
+        >>> from pygob import Loader
+        >>> list(GoArray(142, Loader(), INT, 2).encode((-3, 3)))
+        [2, 5, 6]
+        """
+        out = bytearray()
+        self.encode_into(out, values)
+        return out
+
+    def encode_into(self, out, values):
+        assert len(values) == self._length, \
+            "expected %d elements, found %d" % (self._length, len(values))
+        _encode_elements(self, out, values)
+
+
+def _skip_elements(go_type, buf, pos):
+    """Return the position after the slice or array at pos."""
+    skip = go_type._skip_plan
+    if skip is None:
+        skip = go_type._skip_plan = go_type._loader.skipper(go_type._elem)
+        go_type._loader.compiled(go_type)
+    count, pos = GoUint.decode(buf, pos)
+    for _ in range(count):
+        pos = skip(buf, pos)
+    return pos
+
+
+def _encode_elements(go_type, out, values):
+    """Append the length and elements of a slice or array to out."""
+    out += GoUint.encode(len(values))
+    if type(values).__module__ == 'numpy':
+        from . import ndarray
+        _, encoded = ndarray.encode_array(values, go_type._elem)
+        out += encoded
+        return
+    append = go_type._encode_plan
+    if append is None:
+        append = go_type._encode_plan = appender(
+            go_type._loader.types[go_type._elem])
+    for value in values:
+        append(out, value)
 
 
 class GoSlice(GoType):
@@ -529,8 +999,12 @@ class GoSlice(GoType):
     """
 
     @property
-    def zero(cls):
-        return []
+    def zero(self):
+        # An empty run, so that it has the same type as decoded values.
+        decode_run = self._plan
+        if decode_run is None:
+            decode_run = self.compile()
+        return decode_run(b'', 0, 0)[0]
 
     def __init__(self, typeid, loader, elem):
         """A Go slice of a certain type.
@@ -543,28 +1017,43 @@ class GoSlice(GoType):
         self.typeid = typeid
         self._loader = loader
         self._elem = elem
+        self._plan = None
+
+    def compile(self):
+        """Resolve the decoder for runs of elements once and return it."""
+        self._plan = self._loader.run_decoder(self._elem)
+        self._loader.compiled(self)
+        return self._plan
 
-    def decode(self, buf):
-        """Decode data from buf and return a list.
+    def skip(self, buf, pos=0):
+        """Return the position after the elements at pos."""
+        return _skip_elements(self, buf, pos)
+
+    def decode(self, buf, pos=0):
+        """Decode data from buf at pos and return a list.
 
         Go slices can extended later (with a possible reallocation of
         the underlying array) and are thus similar to Python lists.
         """
-        count, buf = GoUint.decode(buf)
+        decode_run = self._plan
+        if decode_run is None:
+            decode_run = self.compile()
+        count, pos = GoUint.decode(buf, pos)
+        return decode_run(buf, pos, count)
 
-        result = []
-        for i in range(count):
-            value, buf = self._loader.decode_value(self._elem, buf)
-            result.append(value)
-        return result, buf
+    def encode(self, values):
+        """Encode a sequence of values as a Go slice:
 
-    def encode(self, value):
-        buf = bytearray()
-        buf.extend(GoUint.encode(len(value)))
-        for i in value:
-            go_type = self._loader.python_types.get(type(value))
-            buf.extend(go_type.encode(value))
-        return buf
+        >>> from pygob import Loader
+        >>> list(GoSlice(142, Loader(), STRING).encode(['a', 'b']))
+        [2, 1, 97, 1, 98]
+        """
+        out = bytearray()
+        self.encode_into(out, values)
+        return out
+
+    def encode_into(self, out, values):
+        _encode_elements(self, out, values)
 
 
 class GoMap(GoType):
@@ -589,27 +1078,66 @@ class GoMap(GoType):
         self._loader = loader
         self._key_typeid = key_typeid
         self._elem_typeid = elem_typeid
-
-    def decode(self, buf):
-        """Decode data from buf and return a dict."""
-        count, buf = GoUint.decode(buf)
+        self._plan = None
+
+    def compile(self):
+        """Resolve the key and element decoders once and return them."""
+        self._plan = (self._loader.decoder(self._key_typeid),
+                      self._loader.decoder(self._elem_typeid))
+        self._loader.compiled(self)
+        return self._plan
+
+    def decode(self, buf, pos=0):
+        """Decode data from buf at pos and return a dict."""
+        plan = self._plan
+        if plan is None:
+            plan = self.compile()
+        decode_key, decode_elem = plan
+        count, pos = GoUint.decode(buf, pos)
 
         result = {}
         for i in range(count):
-            key, buf = self._loader.decode_value(self._key_typeid, buf)
-            value, buf = self._loader.decode_value(self._elem_typeid, buf)
-            result[key] = value
-        return result, buf
+            key, pos = decode_key(buf, pos)
+            result[key], pos = decode_elem(buf, pos)
+        return result, pos
+
+    def skip(self, buf, pos=0):
+        """Return the position after the map at pos."""
+        plan = self._skip_plan
+        if plan is None:
+            plan = self._skip_plan = (
+                self._loader.skipper(self._key_typeid),
+                self._loader.skipper(self._elem_typeid))
+            self._loader.compiled(self)
+        skip_key, skip_elem = plan
+        count, pos = GoUint.decode(buf, pos)
+        for _ in range(count):
+            pos = skip_elem(buf, skip_key(buf, pos))
+        return pos
 
     def encode(self, value):
-        buf = bytearray()
-        buf.extend(GoUint.encode(len(value)))
-        for i in value:
-            key_type = self._loader.python_types.get(type(i[0]))
-            value_type = self._loader.python_types.get(type(i[1]))
-            buf.extend(key_type.encode(i[0]))
-            buf.extend(value_type.encode([1]))
-        return buf
+        """Encode a dict as a Go map:
+
+        >>> from pygob import Loader
+        >>> list(GoMap(142, Loader(), STRING, INT).encode({'a': -3}))
+        [1, 1, 97, 5]
+        """
+        out = bytearray()
+        self.encode_into(out, value)
+        return out
+
+    def encode_into(self, out, value):
+        plan = self._encode_plan
+        if plan is None:
+            types = self._loader.types
+            plan = self._encode_plan = (
+                appender(types[self._key_typeid]),
+                appender(types[self._elem_typeid]))
+        append_key, append_elem = plan
+        out += GoUint.encode(len(value))
+        for key, elem in value.items():
+            append_key(out, key)
+            append_elem(out, elem)
 
 
 class GoGobEncoder(GoType):
@@ -624,9 +1152,13 @@ class GoGobEncoder(GoType):
         self.typeid = typeid
         self._loader = loader
 
-    def decode(self, buf):
-        count, buf = GoUint.decode(buf)
-        return buf[:count], buf[count:]
+    def decode(self, buf, pos=0):
+        count, pos = GoUint.decode(buf, pos)
+        end = pos + count
+        return bytes(buf[pos:end]), end
+
+    def skip(self, buf, pos=0):
+        return GoByteSlice.skip(buf, pos)
 
     def encode(self, value):
         buf = bytearray()
@@ -647,9 +1179,13 @@ class GoBinaryMarshaler(GoType):
         self.typeid = typeid
         self._loader = loader
 
-    def decode(self, buf):
-        count, buf = GoUint.decode(buf)
-        return buf[:count], buf[count:]
+    def decode(self, buf, pos=0):
+        count, pos = GoUint.decode(buf, pos)
+        end = pos + count
+        return bytes(buf[pos:end]), end
+
+    def skip(self, buf, pos=0):
+        return GoByteSlice.skip(buf, pos)
 
     def encode(self, value):
         buf = bytearray()
@@ -670,12 +1206,221 @@ class GoTextMarshaler(GoType):
         self.typeid = typeid
         self._loader = loader
 
-    def decode(self, buf):
-        count, buf = GoUint.decode(buf)
-        return buf[:count], buf[count:]
+    def decode(self, buf, pos=0):
+        count, pos = GoUint.decode(buf, pos)
+        end = pos + count
+        return bytes(buf[pos:end]), end
+
+    def skip(self, buf, pos=0):
+        return GoByteSlice.skip(buf, pos)
 
     def encode(self, value):
         buf = bytearray()
         buf.extend(GoUint.encode(len(value)))
         buf.extend(value)
         return buf
+
+
+# What interface values of concrete types that are not decoded become.
+OpaqueInterface = record_class('OpaqueInterface', ['Name', 'Typeid', 'Data'])
+
+
+class _Continued(Exception):
+    """Raised when an interface value goes on in the next segment, see
+    GoInterface._read_definitions.
+    """
+
+
+class _Undefined(Exception):
+    """Raised by a loader that shares its types for a type definition it
+    met in an interface value, for the loader decoding the value to add
+    it to its definitions; see Loader._define_inline.
+    """
+
+    def __init__(self, definition):
+        super().__init__(definition)
+        self.definition = definition
+
+
+class GoInterface(GoType):
+    """A Go interface value.
+
+    Interfaces are sent as the name the concrete type was registered
+    under in Go, its type id and the value itself, prefixed with its
+    length. They are mapped to the Python value of the concrete type,
+    and nil interfaces to None. Each loader has its own, see
+    Loader.register_name.
+
+    The first time a concrete type is sent, Go defines it, and the types
+    it is made of, right before its type id. Unless the interface is in
+    another interface value, the segment ends after the definitions and
+    the value goes on in the next one:
+
+    >>> from pygob import Loader
+    >>> buf = bytes.fromhex(
+    ...     '16 7f 03 01 01 03 4d 73 67 01 ff 80 00 01 01 01 01 56 01 10 00'
+    ...     '00 00 1f ff 80 01 06 6d 61 69 6e 2e 50 ff 81 03 01 01 01 50 01'
+    ...     'ff 82 00 01 01 01 01 58 01 04 00 00 00 07 ff 82 03 01 0e 00 00'
+    ...     '11 ff 80 01 06 6d 61 69 6e 2e 50 ff 82 03 01 10 00 00')
+    >>> list(Loader().load_all(buf))
+    [Msg(V=P(X=7)), Msg(V=P(X=8))]
+    """
+    typeid = INTERFACE
+    zero = None
+
+    def __init__(self, loader):
+        self._loader = loader
+        # Concrete type names as sent mapped to (name, convert), where
+        # convert is None for values that are skipped.
+        self._names = {}
+        # Concrete type ids mapped to (decode, singleton), where
+        # singleton is true for values sent with a leading zero byte,
+        # and to (skip, singleton), see skip.
+        self._decoders = {}
+        self._skippers = {}
+        # Definitions met so far, see decode.
+        self._definitions = 0
+
+    def invalidate(self):
+        super().invalidate()
+        self._names = {}
+        self._decoders = {}
+        self._skippers = {}
+
+    def _concrete(self, raw):
+        entry = self._names.get(raw)
+        if entry is None:
+            name = str(raw, 'utf-8')
+            concrete = self._loader._concrete_types
+            if name in concrete:
+                convert = concrete[name] or _identity
+            elif self._loader._interfaces == 'decode':
+                convert = _identity
+            else:
+                convert = None
+            entry = self._names[raw] = (name, convert)
+        return entry
+
+    def _decoder(self, typeid):
+        entry = self._decoders.get(typeid)
+        if entry is None:
+            decode = self._loader.decoder(typeid)
+            entry = self._cache(self._decoders, typeid, decode)
+        return entry
+
+    def _skipper(self, typeid):
+        entry = self._skippers.get(typeid)
+        if entry is None:
+            skip = None
+            if self._holds_interfaces(typeid):
+                skip = self._loader.skipper(typeid)
+            entry = self._cache(self._skippers, typeid, skip)
+        return entry
+
+    def _cache(self, functions, typeid, function):
+        if not self._decoders and not self._skippers:
+            # Redefined type ids and instrumenting clear the caches.
+            self._loader.compiled(self)
+        # Like top-level values, non-structs are sent as singletons.
+        singleton = not isinstance(self._loader.types.get(typeid), GoStruct)
+        entry = functions[typeid] = (function, singleton)
+        return entry
+
+    def _holds_interfaces(self, typeid):
+        """Check if values of typeid can hold interface values."""
+        types = self._loader.types
+        seen = set()
+        pending = [typeid]
+        while pending:
+            typeid = pending.pop()
+            if typeid == INTERFACE:
+                return True
+            if typeid in seen:
+                continue
+            seen.add(typeid)
+            go_type = types.get(typeid)
+            if isinstance(go_type, GoStruct):
+                pending.extend(field for _, field in go_type._fields)
+            elif isinstance(go_type, (GoSlice, GoArray)):
+                pending.append(go_type._elem)
+            elif isinstance(go_type, GoMap):
+                pending += [go_type._key_typeid, go_type._elem_typeid]
+        return False
+
+    def _read_definitions(self, buf, pos):
+        """Define the types sent at pos with our loader, and return the
+        type id of the concrete value after them and its position.
+        """
+        start = pos
+        typeid, pos = GoInt.decode(buf, pos)
+        while typeid < 0:
+            end = self._loader.skipper(WIRE_TYPE)(buf, pos)
+            self._loader._define_inline(bytes(buf[start:end]))
+            self._definitions += 1
+            if end == len(buf):
+                raise _Continued()
+            # The length of what follows, which the value itself may not
+            # account for when it contains definitions as well.
+            _, start = GoUint.decode(buf, end)
+            typeid, pos = GoInt.decode(buf, start)
+        return typeid, pos
+
+    def decode(self, buf, pos=0):
+        """Decode an interface value from buf at pos:
+
+        >>> from pygob import Loader
+        >>> GoInterface(Loader()).decode(b'\\x03int\\x04\\x02\\x00\\x0e')
+        (7, 8)
+        """
+        length, pos = GoUint.decode(buf, pos)
+        if length == 0:
+            return None, pos  # nil
+        raw = bytes(buf[pos:pos + length])
+        name, convert = self._concrete(raw)
+        start = pos + length
+        typeid, pos = GoInt.decode(buf, start)
+        if typeid < 0:
+            typeid, pos = self._read_definitions(buf, start)
+        length, pos = GoUint.decode(buf, pos)
+        end = pos + length
+        if convert is None:
+            end = self._value_end(typeid, buf, pos, end)
+            return OpaqueInterface(name, typeid, bytes(buf[pos:end])), end
+
+        decode, singleton = self._decoder(typeid)
+        definitions = self._definitions
+        if singleton:
+            assert buf[pos] == 0, 'illegal delta for singleton: %s' % buf[pos]
+            pos += 1
+        value, pos = decode(buf, pos)
+        # The length of a value ends where the first interface value in
+        # it defines types, and Go's decoder ignores it.
+        assert pos == end or self._definitions != definitions, (
+            'interface value of %s ends at %d, not %d' % (name, pos, end))
+        return convert(value), pos
+
+    def skip(self, buf, pos=0):
+        length, pos = GoUint.decode(buf, pos)
+        if length == 0:
+            return pos
+        start = pos + length
+        typeid, pos = GoInt.decode(buf, start)
+        if typeid < 0:
+            typeid, pos = self._read_definitions(buf, start)
+        length, pos = GoUint.decode(buf, pos)
+        return self._value_end(typeid, buf, pos, pos + length)
+
+    def _value_end(self, typeid, buf, pos, end):
+        """Return the end of the value of typeid at pos, sent as ending
+        at end.
+        """
+        skip, singleton = self._skipper(typeid)
+        if skip is None:
+            return end
+        # The length leaves out the types that interface values in the
+        # value define, see decode, so it is skipped a field at a time.
+        return skip(buf, pos + 1 if singleton else pos)
+
+
+def _identity(value):
+    return value